@@ -0,0 +1,9 @@
+"""
+Admin URLs for background jobs
+"""
+from django.urls import path
+from .admin_views import JobDetailView
+
+urlpatterns = [
+    path("jobs/<str:job_id>", JobDetailView.as_view(), name="admin_job_detail"),
+]
@@ -0,0 +1,44 @@
+"""
+Admin views for background jobs
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.auth import require_admin
+from .models import Job
+
+
+def _serialize_job(job):
+    return {
+        "id": str(job.id),
+        "name": job.name,
+        "status": job.status,
+        "attempts": job.attempts,
+        "maxAttempts": job.max_attempts,
+        "progress": job.progress or {},
+        "result": job.result or {},
+        # Only the exception line; the full traceback stays in the jobs collection
+        "error": job.last_error.strip().splitlines()[-1] if job.last_error else None,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "updatedAt": job.updated_at.isoformat() if job.updated_at else None,
+        "finishedAt": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobDetailView(APIView):
+    """GET /api/admin/jobs/:id - Status and progress of a background job"""
+    @require_admin
+    def get(self, request, job_id):
+        try:
+            job = Job.objects(id=ObjectId(job_id)).first()
+        except InvalidId:
+            job = None
+        if not job:
+            return Response(
+                {"error": {"code": "RESOURCE_NOT_FOUND", "message": "Job not found"}},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(_serialize_job(job))
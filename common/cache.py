@@ -0,0 +1,309 @@
+"""
+In-process caches invalidated from MongoDB change streams.
+
+``manage.py watch_changes`` (one process per deployment) tails the change
+streams of WATCHED_COLLECTIONS, persisting its resume token so a restart
+replays whatever it missed, and republishes every change as a small
+message in the capped ``cache_invalidations`` collection. Each web process
+tails that collection from a daemon thread and drops the affected entries
+of caches registered with ``register``, so writes from any gunicorn worker
+or from scripts are seen everywhere.
+
+The watcher also publishes a heartbeat. While none has been seen recently
+(watcher down, or change streams unavailable on a standalone mongod)
+entries expire after the cache's short ``fallback_ttl`` instead of ``ttl``.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = (
+    "products",
+    "brands",
+    "parent_categories",
+    "child_categories",
+    "vouchers",
+    "banners",
+)
+INVALIDATIONS_COLLECTION = "cache_invalidations"
+INVALIDATIONS_SIZE_BYTES = 16 * 1024 * 1024
+
+MISSING = object()
+
+_REGISTRY = {}  # collection -> [(cache, watched top-level fields or None)]
+_listener_started = False
+_listener_lock = threading.Lock()
+_last_heartbeat = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Entries may carry ``tags`` (ids of the documents they were built from);
+    a change to one of those documents drops them. Untagged entries depend
+    on the collection as a whole and are dropped on any change to it.
+    """
+
+    def __init__(self, name, ttl=300, fallback_ttl=30, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _max_age(self, entry_ttl):
+        cap = self.ttl if invalidation_live() else self.fallback_ttl
+        return min(entry_ttl, cap)
+
+    def get(self, key, default=MISSING):
+        ensure_listener()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, stored_at, entry_ttl, _ = entry
+            if time.monotonic() - stored_at >= self._max_age(entry_ttl):
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, tags=()):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic(), ttl or self.ttl, frozenset(str(t) for t in tags))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, loader, ttl=None, tags=()):
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value, ttl=ttl, tags=tags)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, document_id=None):
+        """Drop entries built from ``document_id`` (plus untagged ones), or everything."""
+        with self._lock:
+            if document_id is None:
+                self._entries.clear()
+                return
+            document_id = str(document_id)
+            stale = [
+                key for key, (_, _, _, tags) in self._entries.items()
+                if not tags or document_id in tags
+            ]
+            for key in stale:
+                del self._entries[key]
+
+
+class StaleWhileRevalidateCache:
+    """
+    Cache for expensive computations (dashboards) that may lag slightly.
+
+    A value is fresh for ``ttl`` seconds. After that and up to ``max_stale``
+    it is still returned immediately while one background thread recomputes
+    it. Missing or older values are computed inline, single-flight:
+    concurrent callers for the same key wait for that one computation.
+    Not tied to change streams; staleness is bounded by time only.
+
+    Values and single-flight are per process: each web worker computes and
+    refreshes its own copy, so N workers may run the loader N times per key
+    and TTL. Only use it for loaders that are cheap enough to run that often.
+    """
+
+    def __init__(self, name, ttl=30, max_stale=600, maxsize=64):
+        self.name = name
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (value, generated_at, stored_at)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _entry(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def _store(self, key, value):
+        generated_at = datetime.utcnow()
+        with self._lock:
+            self._entries[key] = (value, generated_at, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value, generated_at
+
+    def get(self, key, loader):
+        """Return ``(value, generated_at)``, calling ``loader()`` when needed."""
+        entry = self._entry(key)
+        if entry is not None:
+            value, generated_at, stored_at = entry
+            age = time.monotonic() - stored_at
+            if age < self.ttl:
+                return value, generated_at
+            if age < self.max_stale:
+                self._refresh_in_background(key, loader)
+                return value, generated_at
+
+        with self._key_lock(key):
+            # Whoever held the lock may have just computed it
+            entry = self._entry(key)
+            if entry is not None and time.monotonic() - entry[2] < self.ttl:
+                return entry[0], entry[1]
+            return self._store(key, loader())
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self._store(key, loader())
+            except Exception as exc:
+                logger.warning("Refreshing %s[%s] failed: %s", self.name, key, exc)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"{self.name}-refresh", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def register(cache, *collections, fields=None):
+    """
+    Invalidate ``cache`` on changes to ``collections``.
+
+    With ``fields``, updates that touch none of those top-level fields are
+    ignored (e.g. stock counters for a cache that only reads status).
+    """
+    watched = frozenset(fields) if fields else None
+    for collection in collections:
+        _REGISTRY.setdefault(collection, []).append((cache, watched))
+    return cache
+
+
+def _all_caches():
+    seen = {}
+    for entries in _REGISTRY.values():
+        for cache, _ in entries:
+            seen[id(cache)] = cache
+    return seen.values()
+
+
+def apply_invalidation(message):
+    """Apply one message from the invalidations collection (or a local write)."""
+    op = message.get("op")
+    if op == "reset":
+        for cache in _all_caches():
+            cache.clear()
+        return
+
+    document_id = message.get("id")
+    changed = message.get("fields")
+    for cache, watched in _REGISTRY.get(message.get("coll"), []):
+        if op == "update" and watched is not None and changed is not None:
+            if not watched.intersection(field.split(".", 1)[0] for field in changed):
+                continue
+        if op == "insert" or document_id is None:
+            cache.invalidate()
+        else:
+            cache.invalidate(document_id)
+
+
+def invalidate(collection, document_id=None):
+    """Invalidate immediately in this process, e.g. right after an admin edit."""
+    apply_invalidation({"coll": collection, "id": document_id, "op": "replace"})
+
+
+def invalidation_live():
+    """True while the watcher's heartbeat is fresh."""
+    if _last_heartbeat is None:
+        return False
+    interval = getattr(settings, "CACHE_HEARTBEAT_SECONDS", 10)
+    return time.monotonic() - _last_heartbeat < interval * 3
+
+
+def invalidations_collection(db=None):
+    db = db if db is not None else get_db()
+    if not db.list_collection_names(filter={"name": INVALIDATIONS_COLLECTION}):
+        try:
+            db.create_collection(INVALIDATIONS_COLLECTION, capped=True, size=INVALIDATIONS_SIZE_BYTES)
+        except CollectionInvalid:
+            pass  # Created concurrently
+    return db[INVALIDATIONS_COLLECTION]
+
+
+def ensure_listener():
+    """Start the invalidation listener thread of this process once."""
+    global _listener_started
+    if _listener_started or not getattr(settings, "CACHE_INVALIDATION_ENABLED", True):
+        return
+    with _listener_lock:
+        if _listener_started:
+            return
+        thread = threading.Thread(target=_listen, name="cache-invalidation", daemon=True)
+        thread.start()
+        _listener_started = True
+
+
+def _listen():
+    global _last_heartbeat
+    last_id = None
+    reconnecting = False
+    while True:
+        try:
+            collection = invalidations_collection()
+            if last_id is None:
+                newest = collection.find_one(sort=[("$natural", -1)])
+                last_id = newest["_id"] if newest else None
+            if reconnecting:
+                # Messages may have been missed while disconnected
+                apply_invalidation({"op": "reset"})
+                reconnecting = False
+
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            while cursor.alive:
+                for message in cursor:
+                    last_id = message["_id"]
+                    if message.get("op") == "heartbeat":
+                        _last_heartbeat = time.monotonic()
+                    else:
+                        apply_invalidation(message)
+            # A tailable cursor on an empty capped collection dies immediately
+            time.sleep(1)
+        except Exception as exc:
+            logger.warning("Cache invalidation listener error: %s", exc)
+            reconnecting = True
+            time.sleep(5)
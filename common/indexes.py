@@ -0,0 +1,178 @@
+"""
+Index registry support.
+
+Each app may ship an ``indexes.py`` module declaring:
+
+- ``INDEXES``: ``{collection_name: [spec, ...]}`` where a spec is a dict
+  with ``keys`` (list of ``(field, direction)``) and optional ``name`` plus
+  any ``create_index`` options (``unique``, ``sparse``, ``weights``,
+  ``partialFilterExpression``, ``expireAfterSeconds``, ...).
+- ``QUERIES``: hot query shapes to verify with ``explain()``. Each entry has
+  a ``name``, a ``collection`` and either ``filter`` (+ optional ``sort``,
+  ``limit``) or an aggregation ``pipeline``.
+
+``manage.py sync_indexes`` diff-applies the declared indexes and can check
+that no registered query falls back to a collection scan.
+"""
+import importlib
+import importlib.util
+
+from django.apps import apps
+from pymongo import TEXT
+
+# Options that make two indexes on the same keys different
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights")
+
+
+def iter_registries():
+    """Yield (app_label, module) for every installed app with an indexes module."""
+    for app_config in apps.get_app_configs():
+        module_name = f"{app_config.name}.indexes"
+        if importlib.util.find_spec(module_name) is None:
+            continue
+        yield app_config.label, importlib.import_module(module_name)
+
+
+def collect_indexes():
+    """Merge INDEXES of all registries: {collection: [spec, ...]}."""
+    merged = {}
+    for _, module in iter_registries():
+        for collection, specs in getattr(module, "INDEXES", {}).items():
+            merged.setdefault(collection, []).extend(specs)
+    return merged
+
+
+def collect_queries():
+    queries = []
+    for _, module in iter_registries():
+        queries.extend(getattr(module, "QUERIES", []))
+    return queries
+
+
+def index_name(spec):
+    if spec.get("name"):
+        return spec["name"]
+    return "_".join(f"{field}_{direction}" for field, direction in spec["keys"])
+
+
+def is_text_index(spec):
+    return any(direction == TEXT for _, direction in spec["keys"])
+
+
+def index_options(spec):
+    return {key: value for key, value in spec.items() if key not in ("keys", "name")}
+
+
+def _same_options(spec, info):
+    wanted = index_options(spec)
+    for option in COMPARED_OPTIONS:
+        if option == "weights" and not is_text_index(spec):
+            continue
+        if wanted.get(option) != info.get(option):
+            # unique/sparse default to False when absent
+            if not wanted.get(option) and not info.get(option):
+                continue
+            return False
+    return True
+
+
+def diff_indexes(collection, specs):
+    """
+    Compare declared specs with the live indexes of ``collection``.
+
+    Returns a list of ``(action, spec, existing_name)`` where action is
+    ``ok``, ``create`` or ``replace`` (drop ``existing_name`` then create,
+    restoring it if the new index fails).
+    """
+    existing = collection.index_information()
+    by_keys = {tuple(info["key"]): name for name, info in existing.items()}
+    plan = []
+    for spec in specs:
+        name = index_name(spec)
+        if is_text_index(spec):
+            # Text indexes are stored as _fts/_ftsx keys and a collection can
+            # only hold one, so any existing text index is the candidate.
+            current = next(
+                (n for n, info in existing.items() if any(d == TEXT for _, d in info["key"])),
+                None,
+            )
+            keys_match = True
+        else:
+            current = by_keys.get(tuple(spec["keys"]))
+            keys_match = current is not None
+            if current is None and name in existing:
+                current = name  # Same name, different keys
+        if current is None:
+            plan.append(("create", spec, None))
+        elif not keys_match or not _same_options(spec, existing[current]):
+            plan.append(("replace", spec, current))
+        else:
+            plan.append(("ok", spec, current))
+    return plan
+
+
+def _spec_from_info(name, info):
+    """Spec recreating a live index from its ``index_information()`` entry."""
+    keys = []
+    for field, direction in info["key"]:
+        if field == "_fts":
+            keys.extend((text_field, TEXT) for text_field in info.get("weights", {}))
+        elif field != "_ftsx":
+            keys.append((field, direction))
+    options = {
+        key: value
+        for key, value in info.items()
+        if key not in ("key", "v", "ns", "textIndexVersion")
+    }
+    return {"keys": keys, "name": name, **options}
+
+
+def apply_plan(collection, plan):
+    """
+    Apply ``diff_indexes`` steps. A replaced index is dropped first (same
+    keys cannot be indexed twice); if its replacement cannot be built
+    (duplicates for a new unique index, option conflicts) the original is
+    recreated before the error is raised, so the collection never stays
+    without it.
+    """
+    existing = collection.index_information()
+    for action, spec, existing_name in plan:
+        if action == "create":
+            collection.create_index(spec["keys"], name=index_name(spec), **index_options(spec))
+        elif action == "replace":
+            original = _spec_from_info(existing_name, existing[existing_name])
+            collection.drop_index(existing_name)
+            try:
+                collection.create_index(spec["keys"], name=index_name(spec), **index_options(spec))
+            except Exception:
+                collection.create_index(original["keys"], name=original["name"], **index_options(original))
+                raise
+
+
+def _find_stages(plan, stages):
+    """Recursively collect stage names from an explain() plan."""
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if stage:
+            stages.append(stage)
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                _find_stages(value, stages)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_stages(value, stages)
+    return stages
+
+
+def explain_query(db, query):
+    """Return the stage names of the winning plan for a registered query."""
+    collection = db[query["collection"]]
+    if "pipeline" in query:
+        result = db.command("aggregate", query["collection"], pipeline=query["pipeline"], explain=True)
+        return _find_stages(result, [])
+    cursor = collection.find(query.get("filter", {}))
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+    cursor = cursor.limit(query.get("limit", 20))
+    explained = cursor.explain()
+    return _find_stages(explained.get("queryPlanner", {}).get("winningPlan", {}), [])
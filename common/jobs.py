@@ -0,0 +1,255 @@
+"""
+Lightweight MongoDB-backed job queue.
+
+Handlers are registered with ``@job("name")`` in an app's ``tasks.py`` and
+enqueued by name from request code; ``manage.py run_worker`` leases jobs
+with ``find_one_and_update``, runs them and retries failures with
+exponential backoff. Work that does not have to finish before the response
+(rating recomputation, notifications, ...) goes through here so request
+latency reflects only the critical path.
+
+With ``JOBS_EAGER = True`` jobs run inline in the enqueuing process, which
+is handy for local development without a worker.
+"""
+import importlib
+import importlib.util
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+from pymongo import ReturnDocument
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_HANDLERS = {}
+_discovered = False
+
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 3600
+
+
+def job(name, max_attempts=5, every=None):
+    """
+    Register ``func(payload, job)`` as the handler for jobs called ``name``.
+
+    With ``every`` (seconds) the job is periodic: the worker schedules it on
+    startup and re-enqueues it that long after each run.
+    """
+    def decorator(func):
+        _HANDLERS[name] = {"func": func, "max_attempts": max_attempts, "every": every}
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import ``tasks`` modules of installed apps so their handlers register."""
+    global _discovered
+    if _discovered:
+        return
+    for app_config in apps.get_app_configs():
+        module_name = f"{app_config.name}.tasks"
+        if importlib.util.find_spec(module_name) is not None:
+            importlib.import_module(module_name)
+    _discovered = True
+
+
+def schedule_periodic():
+    """Make sure every periodic job has a queued run; returns their names."""
+    autodiscover()
+    names = []
+    for name, handler in _HANDLERS.items():
+        if handler["every"]:
+            enqueue(name, dedupe_key=f"periodic:{name}")
+            names.append(name)
+    return names
+
+
+def get_handler(name):
+    autodiscover()
+    return _HANDLERS.get(name)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(name, payload=None, delay=0, dedupe_key=None, max_attempts=None):
+    """
+    Queue a job; returns the Job.
+
+    With ``dedupe_key``, an identical job that is still queued (not yet
+    picked up) is returned instead of creating a second one.
+    """
+    handler = get_handler(name)
+    if handler is None:
+        raise ValueError(f"Unknown job: {name}")
+
+    now = datetime.utcnow()
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        run_at=now + timedelta(seconds=delay),
+        max_attempts=max_attempts or handler["max_attempts"],
+        dedupe_key=dedupe_key,
+    )
+    try:
+        new_job.save(force_insert=True)
+    except NotUniqueError:
+        existing = Job.objects(dedupe_key=dedupe_key).first()
+        if existing:
+            return existing
+        new_job.save(force_insert=True)
+
+    if getattr(settings, "JOBS_EAGER", False) and not delay:
+        claimed = claim(worker_id(), job_id=new_job.id)
+        if claimed:
+            run(claimed)
+            claimed.reload()
+            return claimed
+    return new_job
+
+
+def defer(name, payload=None, **kwargs):
+    """
+    Enqueue from request code without letting queue problems fail the request.
+
+    If the job cannot be queued it is run inline instead.
+    """
+    try:
+        return enqueue(name, payload, **kwargs)
+    except Exception as exc:
+        logger.warning("Could not enqueue job %s, running inline: %s", name, exc)
+        handler = get_handler(name)
+        if handler:
+            try:
+                handler["func"](payload or {}, None)
+            except Exception as inline_exc:
+                logger.error("Inline job %s failed: %s", name, inline_exc, exc_info=True)
+        return None
+
+
+def claim(locked_by, lease_seconds=None, job_id=None):
+    """Lease the next runnable job (or ``job_id``); return it or None."""
+    now = datetime.utcnow()
+    lease_seconds = lease_seconds or getattr(settings, "JOBS_LEASE_SECONDS", 300)
+    query = {
+        "$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]
+    }
+    if job_id is not None:
+        query["_id"] = job_id
+    doc = Job._get_collection().find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": "running",
+                "locked_by": locked_by,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+            # Released on claim so work arriving while this runs queues a fresh job
+            "$unset": {"dedupe_key": ""},
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    return Job._from_son(doc) if doc else None
+
+
+def heartbeat(job_obj, lease_seconds=None, **progress):
+    """Extend the lease of a long-running job and optionally record progress."""
+    if job_obj is None:
+        return
+    now = datetime.utcnow()
+    lease_seconds = lease_seconds or getattr(settings, "JOBS_LEASE_SECONDS", 300)
+    update = {"lease_expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}
+    for key, value in progress.items():
+        update[f"progress.{key}"] = value
+    Job._get_collection().update_one(
+        {"_id": job_obj.id, "locked_by": job_obj.locked_by},
+        {"$set": update},
+    )
+
+
+def _finished_expiry(now):
+    return now + timedelta(seconds=getattr(settings, "JOBS_RETENTION_SECONDS", 7 * 24 * 3600))
+
+
+def complete(job_obj, result=None):
+    now = datetime.utcnow()
+    Job._get_collection().update_one(
+        {"_id": job_obj.id, "locked_by": job_obj.locked_by},
+        {
+            "$set": {
+                "status": "done",
+                "result": result or {},
+                "finished_at": now,
+                "updated_at": now,
+                "expires_at": _finished_expiry(now),
+            },
+            "$unset": {"dedupe_key": "", "lease_expires_at": ""},
+        },
+    )
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def fail(job_obj, exc):
+    """Schedule a retry with exponential backoff, or mark the job failed."""
+    now = datetime.utcnow()
+    error = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+    if job_obj.attempts < job_obj.max_attempts:
+        update = {
+            "$set": {
+                "status": "queued",
+                "run_at": now + timedelta(seconds=backoff_seconds(job_obj.attempts)),
+                "last_error": error,
+                "updated_at": now,
+            },
+            "$unset": {"locked_by": "", "lease_expires_at": ""},
+        }
+    else:
+        update = {
+            "$set": {
+                "status": "failed",
+                "last_error": error,
+                "finished_at": now,
+                "updated_at": now,
+                "expires_at": _finished_expiry(now),
+            },
+            "$unset": {"dedupe_key": "", "lease_expires_at": ""},
+        }
+    Job._get_collection().update_one({"_id": job_obj.id, "locked_by": job_obj.locked_by}, update)
+
+
+def run(job_obj):
+    """Execute a claimed job and record the outcome. Returns True on success."""
+    handler = get_handler(job_obj.name)
+    if handler is None:
+        fail(job_obj, ValueError(f"No handler registered for job {job_obj.name}"))
+        return False
+    try:
+        result = handler["func"](job_obj.payload or {}, job_obj)
+    except Exception as exc:
+        logger.warning("Job %s (%s) failed on attempt %s: %s", job_obj.id, job_obj.name, job_obj.attempts, exc)
+        fail(job_obj, exc)
+        return False
+    finally:
+        if handler["every"]:
+            enqueue(job_obj.name, delay=handler["every"], dedupe_key=f"periodic:{job_obj.name}")
+    complete(job_obj, result if isinstance(result, dict) else None)
+    return True
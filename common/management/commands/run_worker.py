@@ -0,0 +1,70 @@
+"""
+Run background jobs from the jobs collection and deliver outbox events.
+
+Usage:
+    python manage.py run_worker                   # poll forever
+    python manage.py run_worker --once            # drain runnable jobs, then exit
+    python manage.py run_worker --poll-interval 5
+
+SIGTERM/SIGINT finish the current job before exiting.
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from common import jobs, outbox
+
+
+class Command(BaseCommand):
+    help = "Lease and run queued background jobs and deliver outbox events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when no job is runnable")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when idle")
+        parser.add_argument("--event-batch-size", type=int, default=100, help="Outbox events delivered per batch")
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        jobs.autodiscover()
+        outbox.autodiscover()
+        for name in jobs.schedule_periodic():
+            self.stdout.write(f"  scheduled periodic job {name}")
+        locked_by = jobs.worker_id()
+        self.stdout.write(f"Worker {locked_by} started")
+
+        processed = failed = delivered = 0
+        while not self._stopping:
+            sent, undelivered = outbox.dispatch_batch(locked_by, options["event_batch_size"])
+            delivered += sent
+            if undelivered:
+                self.stdout.write(self.style.WARNING(f"  ✗ {undelivered} event(s) will be retried"))
+
+            current = jobs.claim(locked_by)
+            if current is None:
+                if sent or undelivered:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            started = time.monotonic()
+            ok = jobs.run(current)
+            elapsed_ms = (time.monotonic() - started) * 1000
+            processed += 1
+            if ok:
+                self.stdout.write(f"  ✓ {current.name} {current.id} ({elapsed_ms:.0f} ms)")
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(
+                    f"  ✗ {current.name} {current.id} attempt {current.attempts}/{current.max_attempts}"
+                ))
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Worker stopped: {processed} job(s) run, {failed} failed, {delivered} event(s) delivered"))
+
+    def _stop(self, signum, frame):
+        self._stopping = True
@@ -0,0 +1,77 @@
+"""
+Create or update the MongoDB indexes declared in each app's indexes.py.
+
+Usage:
+    python manage.py sync_indexes              # apply missing/changed indexes
+    python manage.py sync_indexes --dry-run    # only show what would change
+    python manage.py sync_indexes --check      # also explain() registered queries
+"""
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+
+from common.indexes import (
+    apply_plan,
+    collect_indexes,
+    collect_queries,
+    diff_indexes,
+    explain_query,
+    index_name,
+)
+
+
+class Command(BaseCommand):
+    help = "Diff-apply registered MongoDB indexes and check query plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Show the plan without changing anything")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Run explain() on registered queries and fail on collection scans",
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        dry_run = options["dry_run"]
+
+        changes = 0
+        for collection_name, specs in sorted(collect_indexes().items()):
+            collection = db[collection_name]
+            plan = diff_indexes(collection, specs)
+            self.stdout.write(f"\n{collection_name}")
+            for action, spec, existing_name in plan:
+                name = index_name(spec)
+                if action == "ok":
+                    self.stdout.write(f"  ✓ {existing_name}")
+                elif action == "create":
+                    self.stdout.write(self.style.WARNING(f"  + {name}"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"  ~ {existing_name} -> {name}"))
+            pending = [step for step in plan if step[0] != "ok"]
+            changes += len(pending)
+            if pending and not dry_run:
+                apply_plan(collection, pending)
+
+        if dry_run:
+            self.stdout.write(f"\n{changes} index change(s) pending (dry run)")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"\n✓ {changes} index change(s) applied"))
+
+        if options["check"]:
+            self._check_queries(db)
+
+    def _check_queries(self, db):
+        self.stdout.write("\nQuery plans")
+        failures = []
+        for query in collect_queries():
+            stages = explain_query(db, query)
+            if "COLLSCAN" in stages:
+                failures.append(query["name"])
+                self.stdout.write(self.style.ERROR(f"  ✗ {query['name']}: {' <- '.join(stages)}"))
+            elif "SORT" in stages:
+                self.stdout.write(self.style.WARNING(f"  ! {query['name']}: in-memory sort ({' <- '.join(stages)})"))
+            else:
+                self.stdout.write(f"  ✓ {query['name']}: {' <- '.join(stages)}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} registered query(ies) use a collection scan: {', '.join(failures)}")
@@ -0,0 +1,132 @@
+"""
+Tail MongoDB change streams and publish cache invalidations.
+
+Usage:
+    python manage.py watch_changes
+
+Run one instance per deployment. Needs a replica set (a single-node one is
+enough locally: `mongod --replSet rs0` then `rs.initiate()`); without it
+caches fall back to TTL expiry. The resume token is stored in
+change_stream_tokens, so a restarted watcher replays what it missed.
+SIGTERM/SIGINT stop it cleanly.
+"""
+import signal
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+from pymongo.errors import OperationFailure, PyMongoError
+
+from common.cache import WATCHED_COLLECTIONS, invalidations_collection
+from common.models import ChangeStreamToken
+
+WATCHER_NAME = "cache_invalidation"
+TOKEN_SAVE_INTERVAL_SECONDS = 1.0
+
+# Server error codes
+NOT_A_REPLICA_SET = 40573
+CHANGE_STREAM_FATAL = 280
+CHANGE_STREAM_HISTORY_LOST = 286
+
+PIPELINE = [
+    {"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)}}},
+    {
+        # Only the names of updated fields, never their (possibly large) values
+        "$project": {
+            "ns": 1,
+            "documentKey": 1,
+            "operationType": 1,
+            "fields": {
+                "$concatArrays": [
+                    {
+                        "$map": {
+                            "input": {"$objectToArray": {"$ifNull": ["$updateDescription.updatedFields", {}]}},
+                            "as": "field",
+                            "in": "$$field.k",
+                        }
+                    },
+                    {"$ifNull": ["$updateDescription.removedFields", []]},
+                ]
+            },
+        }
+    },
+]
+
+
+class Command(BaseCommand):
+    help = "Publish cache invalidations from MongoDB change streams"
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        db = get_db()
+        self.target = invalidations_collection(db)
+        self.heartbeat_interval = getattr(settings, "CACHE_HEARTBEAT_SECONDS", 10)
+
+        while not self._stopping:
+            saved = ChangeStreamToken.objects(name=WATCHER_NAME).first()
+            token = saved.token if saved else None
+            if token is None:
+                # Nothing to resume from: caches may hold anything
+                self.target.insert_one({"op": "reset", "at": datetime.utcnow()})
+            try:
+                self._watch(db, token)
+            except OperationFailure as exc:
+                if exc.code == NOT_A_REPLICA_SET:
+                    raise CommandError(
+                        "Change streams need a replica set; caches fall back to TTL expiry"
+                    ) from exc
+                if exc.code in (CHANGE_STREAM_HISTORY_LOST, CHANGE_STREAM_FATAL):
+                    self.stdout.write(self.style.WARNING("Resume token is no longer in the oplog, starting over"))
+                    ChangeStreamToken.objects(name=WATCHER_NAME).delete()
+                    continue
+                raise
+            except PyMongoError as exc:
+                self.stdout.write(self.style.WARNING(f"Change stream error, retrying: {exc}"))
+                time.sleep(5)
+
+        self.stdout.write(self.style.SUCCESS("✓ Watcher stopped"))
+
+    def _watch(self, db, token):
+        published = 0
+        last_saved = last_heartbeat = 0.0
+        self.stdout.write(f"Watching {', '.join(WATCHED_COLLECTIONS)}" + (" (resuming)" if token else ""))
+        with db.watch(PIPELINE, resume_after=token, max_await_time_ms=1000) as stream:
+            while not self._stopping and stream.alive:
+                change = stream.try_next()
+                now = time.monotonic()
+                if change is not None:
+                    if change["operationType"] == "invalidate":
+                        # The stream cannot be resumed past an invalidate event
+                        ChangeStreamToken.objects(name=WATCHER_NAME).delete()
+                        return
+                    if change["operationType"] in ("drop", "rename", "dropDatabase"):
+                        self.target.insert_one({"op": "reset", "at": datetime.utcnow()})
+                    else:
+                        self.target.insert_one({
+                            "coll": change["ns"]["coll"],
+                            "id": str(change["documentKey"]["_id"]),
+                            "op": change["operationType"],
+                            "fields": change.get("fields") if change["operationType"] == "update" else None,
+                        })
+                    published += 1
+                if now - last_heartbeat >= self.heartbeat_interval:
+                    self.target.insert_one({"op": "heartbeat", "at": datetime.utcnow()})
+                    last_heartbeat = now
+                # Saving after publishing means a crash can only republish, never skip
+                if stream.resume_token and now - last_saved >= TOKEN_SAVE_INTERVAL_SECONDS:
+                    ChangeStreamToken.objects(name=WATCHER_NAME).update_one(
+                        set__token=dict(stream.resume_token),
+                        set__updated_at=datetime.utcnow(),
+                        upsert=True,
+                    )
+                    last_saved = now
+        if published:
+            self.stdout.write(f"  {published} change(s) published")
+
+    def _stop(self, signum, frame):
+        self._stopping = True
@@ -0,0 +1,82 @@
+"""
+Common models: background jobs, the event outbox and change stream state
+"""
+import mongoengine as me
+from datetime import datetime
+
+
+class Job(me.Document):
+    """Background job leased by `manage.py run_worker`"""
+    name = me.StringField(required=True)  # Registered handler name, e.g. "orders.sync_product_rating"
+    payload = me.DictField()
+    status = me.StringField(
+        choices=["queued", "running", "done", "failed"],
+        default="queued"
+    )
+    run_at = me.DateTimeField(default=datetime.utcnow)  # Not picked up before this time
+    attempts = me.IntField(default=0)
+    max_attempts = me.IntField(default=5)
+
+    # Lease: a running job whose lease expired is picked up again
+    locked_by = me.StringField()
+    lease_expires_at = me.DateTimeField()
+
+    # Set while queued so the same logical job is not enqueued twice
+    dedupe_key = me.StringField()
+
+    progress = me.DictField()  # Free-form progress reported by the handler
+    result = me.DictField()
+    last_error = me.StringField()
+
+    created_at = me.DateTimeField(default=datetime.utcnow)
+    updated_at = me.DateTimeField(default=datetime.utcnow)
+    finished_at = me.DateTimeField()
+    expires_at = me.DateTimeField()  # Finished jobs are removed by the TTL index
+
+    meta = {
+        "collection": "jobs",
+        "indexes": [
+            ("status", "run_at"),
+            ("status", "lease_expires_at"),
+            {"fields": ["dedupe_key"], "unique": True, "sparse": True},
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+        ]
+    }
+
+
+class OutboxEvent(me.Document):
+    """Domain event recorded next to the business write, delivered by the worker"""
+    type = me.StringField(required=True)  # e.g. "order.created", "product.updated"
+    payload = me.DictField()
+    status = me.StringField(
+        choices=["pending", "processing", "dispatched", "failed"],
+        default="pending"
+    )
+    available_at = me.DateTimeField(default=datetime.utcnow)  # Retries are pushed back
+    attempts = me.IntField(default=0)
+
+    locked_by = me.StringField()
+    lease_expires_at = me.DateTimeField()
+    last_error = me.StringField()
+
+    created_at = me.DateTimeField(default=datetime.utcnow)
+    dispatched_at = me.DateTimeField()
+    expires_at = me.DateTimeField()  # Delivered events are removed by the TTL index
+
+    meta = {
+        "collection": "outbox",
+        "indexes": [
+            ("status", "available_at"),
+            ("status", "lease_expires_at"),
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+        ]
+    }
+
+
+class ChangeStreamToken(me.Document):
+    """Last processed change stream resume token of a named watcher"""
+    name = me.StringField(primary_key=True)
+    token = me.DictField()
+    updated_at = me.DateTimeField(default=datetime.utcnow)
+
+    meta = {"collection": "change_stream_tokens"}
@@ -0,0 +1,179 @@
+"""
+Transactional outbox of domain events.
+
+Write paths call ``record_event`` with the same session as the business
+write when they run in a transaction (otherwise right after it), so an
+event exists exactly when the change it describes was committed.
+``manage.py run_worker`` delivers pending events in batches to handlers
+registered with ``@subscribe("type")`` in an app's ``handlers.py``.
+
+Delivery is at-least-once: a batch whose worker dies is leased again and
+an event whose handler raises is retried with backoff, re-running every
+handler for it. Handlers must therefore be idempotent; ``event["id"]`` is
+stable across deliveries.
+
+Event types:
+
+- ``order.created``: orderId, orderNumber, userId, status, total, createdAt, items
+- ``order.status_changed``: orderId, orderNumber, userId, from, to, total, createdAt
+- ``review.created``: reviewId, orderId, userId, productId, rating
+- ``product.updated``: productId, action (created|updated|deleted)
+"""
+import importlib
+import importlib.util
+import logging
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_SUBSCRIBERS = {}
+_discovered = False
+
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+
+
+def subscribe(event_type):
+    """Register ``func(event)`` to receive events of ``event_type``."""
+    def decorator(func):
+        _SUBSCRIBERS.setdefault(event_type, []).append(func)
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Import ``handlers`` modules of installed apps so their subscribers register."""
+    global _discovered
+    if _discovered:
+        return
+    for app_config in apps.get_app_configs():
+        module_name = f"{app_config.name}.handlers"
+        if importlib.util.find_spec(module_name) is not None:
+            importlib.import_module(module_name)
+    _discovered = True
+
+
+def record_event(event_type, payload, session=None):
+    """Insert an event; pass the write's ``session`` to commit it atomically with it."""
+    now = datetime.utcnow()
+    doc = {
+        "type": event_type,
+        "payload": payload,
+        "status": "pending",
+        "available_at": now,
+        "attempts": 0,
+        "created_at": now,
+    }
+    inserted = OutboxEvent._get_collection().insert_one(doc, session=session)
+    if session is None:
+        dispatch_if_eager()
+    return inserted.inserted_id
+
+
+def dispatch_if_eager():
+    """With JOBS_EAGER there is no worker, so deliver pending events inline."""
+    if getattr(settings, "JOBS_EAGER", False):
+        try:
+            dispatch_batch(f"eager:{uuid.uuid4().hex}")
+        except Exception as exc:
+            logger.warning("Inline event dispatch failed: %s", exc)
+
+
+def claim_batch(locked_by, batch_size=100, lease_seconds=None):
+    """Lease up to ``batch_size`` deliverable events, oldest first."""
+    now = datetime.utcnow()
+    lease_seconds = lease_seconds or getattr(settings, "JOBS_LEASE_SECONDS", 300)
+    collection = OutboxEvent._get_collection()
+    query = {
+        "$or": [
+            {"status": "pending", "available_at": {"$lte": now}},
+            {"status": "processing", "lease_expires_at": {"$lt": now}},
+        ]
+    }
+    ids = [
+        doc["_id"]
+        for doc in collection.find(query, {"_id": 1}).sort("available_at", 1).limit(batch_size)
+    ]
+    if not ids:
+        return []
+    query["_id"] = {"$in": ids}
+    collection.update_many(
+        query,
+        {
+            "$set": {
+                "status": "processing",
+                "locked_by": locked_by,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+            },
+            "$inc": {"attempts": 1},
+        },
+    )
+    # Another worker may have won some of them between the find and the update
+    return list(
+        collection.find({"_id": {"$in": ids}, "locked_by": locked_by, "status": "processing"})
+        .sort("available_at", 1)
+    )
+
+
+def _backoff_seconds(attempts):
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+
+def dispatch_batch(locked_by, batch_size=100):
+    """Deliver one batch; returns (delivered, failed)."""
+    autodiscover()
+    events = claim_batch(locked_by, batch_size)
+    if not events:
+        return 0, 0
+
+    now = datetime.utcnow()
+    retention = timedelta(seconds=getattr(settings, "JOBS_RETENTION_SECONDS", 7 * 24 * 3600))
+    operations = []
+    failed = 0
+    for doc in events:
+        event = {
+            "id": str(doc["_id"]),
+            "type": doc["type"],
+            "payload": doc.get("payload") or {},
+            "created_at": doc.get("created_at"),
+        }
+        try:
+            for handler in _SUBSCRIBERS.get(doc["type"], []):
+                handler(event)
+        except Exception as exc:
+            failed += 1
+            logger.warning("Handler for event %s (%s) failed: %s", event["id"], event["type"], exc)
+            error = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-4000:]
+            attempts = doc.get("attempts", 1)
+            if attempts < MAX_ATTEMPTS:
+                update = {
+                    "$set": {
+                        "status": "pending",
+                        "available_at": now + timedelta(seconds=_backoff_seconds(attempts)),
+                        "last_error": error,
+                    },
+                    "$unset": {"locked_by": "", "lease_expires_at": ""},
+                }
+            else:
+                update = {
+                    "$set": {"status": "failed", "last_error": error, "expires_at": now + retention},
+                    "$unset": {"lease_expires_at": ""},
+                }
+        else:
+            update = {
+                "$set": {"status": "dispatched", "dispatched_at": now, "expires_at": now + retention},
+                "$unset": {"lease_expires_at": ""},
+            }
+        operations.append(UpdateOne({"_id": doc["_id"], "locked_by": locked_by}, update))
+
+    OutboxEvent._get_collection().bulk_write(operations, ordered=False)
+    return len(events) - failed, failed
@@ -15,6 +15,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions","django.contrib.messages","django.contrib.staticfiles",
     "rest_framework","corsheaders",'users.apps.UsersConfig','orders.apps.OrdersConfig','notifications.apps.NotificationsConfig',
     'products.apps.ProductsConfig',
+    'common.apps.CommonConfig',
     "storages",
     "drf_yasg",
 ]
@@ -58,6 +59,33 @@ if not (MONGODB_URI.startswith("mongodb://") or MONGODB_URI.startswith("mongodb+
 
 mongoengine.connect(host=MONGODB_URI, db=MONGODB_DB)
 
+# Order numbers reserved per round trip to the counters collection (1 = strictly sequential)
+ORDER_NUMBER_BLOCK_SIZE = int(os.getenv("ORDER_NUMBER_BLOCK_SIZE", "1"))
+# "transaction" runs checkout writes in one multi-document transaction (needs a replica set);
+# "sequential" issues them one by one with compensation on failure
+ORDER_CHECKOUT_MODE = os.getenv("ORDER_CHECKOUT_MODE", "sequential").strip().lower()
+# How long responses to requests with an Idempotency-Key header are kept for replay
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", str(24 * 3600)))
+# Background jobs: run inline instead of by `manage.py run_worker` (local development)
+JOBS_EAGER = os.getenv("JOBS_EAGER", "false").lower() in ("1", "true", "yes")
+# A running job whose worker stops heartbeating is picked up again after this lease
+JOBS_LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", "300"))
+# In-process caches: listen for invalidations published by `manage.py watch_changes`
+CACHE_INVALIDATION_ENABLED = os.getenv("CACHE_INVALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Interval of the watcher's heartbeat; caches use their short fallback TTL when it stops
+CACHE_HEARTBEAT_SECONDS = int(os.getenv("CACHE_HEARTBEAT_SECONDS", "10"))
+# How often the worker marks wallet vouchers of expired vouchers as expired
+VOUCHER_EXPIRY_SWEEP_SECONDS = int(os.getenv("VOUCHER_EXPIRY_SWEEP_SECONDS", "600"))
+# Dashboard/analytics read the daily_sales rollups (build them with `manage.py rebuild_daily_sales`);
+# periods whose days are not all rolled up yet are still computed from orders
+ANALYTICS_USE_ROLLUPS = os.getenv("ANALYTICS_USE_ROLLUPS", "false").lower() in ("1", "true", "yes")
+# How often the worker refreshes today's rollup (picks up new customers without orders)
+ANALYTICS_ROLLUP_SECONDS = int(os.getenv("ANALYTICS_ROLLUP_SECONDS", "300"))
+# Dashboard/analytics results are fresh this long, then served stale (up to the max) while refreshed.
+# Cached per web process: each worker recomputes its own copy once per TTL
+DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "30"))
+DASHBOARD_CACHE_MAX_STALE_SECONDS = int(os.getenv("DASHBOARD_CACHE_MAX_STALE_SECONDS", "600"))
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "Asia/Ho_Chi_Minh"
 USE_I18N = True
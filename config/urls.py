@@ -82,6 +82,7 @@ urlpatterns = [
     # Admin APIs
     path("api/admin/", include("products.admin_urls")),
     path("api/admin/", include("orders.admin_urls")),
+    path("api/admin/", include("common.admin_urls")),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,61 @@
+"""
+Outbox event handlers for notifications (delivered by `manage.py run_worker`)
+"""
+from bson import ObjectId
+
+from common.outbox import subscribe
+from .models import Notification, NotificationDetail
+
+ORDER_STATUS_MESSAGES = {
+    "pending": ("Đặt hàng thành công", "Đơn hàng {order_number} đã được đặt và đang chờ xác nhận."),
+    "processing": ("Đơn hàng đang được xử lý", "Đơn hàng {order_number} đang được chuẩn bị."),
+    "shipping": ("Đơn hàng đang được giao", "Đơn hàng {order_number} đã được giao cho đơn vị vận chuyển."),
+    "completed": ("Đơn hàng đã hoàn thành", "Đơn hàng {order_number} đã được giao thành công."),
+    "cancelled": ("Đơn hàng đã bị hủy", "Đơn hàng {order_number} đã bị hủy."),
+}
+
+
+def push_notification(user_id, title, content, type_, event_id):
+    """
+    Append a notification to the user's notification document (created on first use).
+
+    Keyed by ``event_id`` so a redelivered event does not add it twice.
+    """
+    collection = Notification._get_collection()
+    detail = NotificationDetail(title=title, content=content, type=type_, event_id=event_id).to_mongo().to_dict()
+    result = collection.update_one(
+        {"user": ObjectId(user_id), "notifications.event_id": {"$ne": event_id}},
+        {"$push": {"notifications": detail}},
+    )
+    if result.matched_count == 0:
+        # Either already delivered or the user has no notification document yet
+        collection.update_one(
+            {"user": ObjectId(user_id)},
+            {"$setOnInsert": {"notifications": [detail]}},
+            upsert=True,
+        )
+
+
+def _notify_order_status(event, status):
+    message = ORDER_STATUS_MESSAGES.get(status)
+    payload = event["payload"]
+    if not message or not payload.get("userId"):
+        return
+    title, content = message
+    push_notification(
+        payload["userId"],
+        title,
+        content.format(order_number=payload.get("orderNumber") or ""),
+        "order_status",
+        event["id"],
+    )
+
+
+@subscribe("order.created")
+def notify_order_created(event):
+    _notify_order_status(event, event["payload"].get("status"))
+
+
+@subscribe("order.status_changed")
+def notify_order_status_changed(event):
+    _notify_order_status(event, event["payload"].get("to"))
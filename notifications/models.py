@@ -18,6 +18,7 @@ class NotificationDetail(me.EmbeddedDocument):
     # 'promotion', 'order_status', 'system_update'
     type = me.StringField()
     read = me.BooleanField(default=False)
+    event_id = me.StringField()  # Outbox event that produced it (for idempotent delivery)
     created_at = me.DateTimeField(default=datetime.utcnow)
 
 class Notification(me.Document):
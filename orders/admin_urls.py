@@ -3,9 +3,9 @@ Admin URLs for orders and customers management
 """
 from django.urls import path
 from .admin_views import (
-    OrderListView, OrderDetailView, OrderStatusUpdateView,
-    CustomerListView, CustomerDetailView, CustomerStatusUpdateView,
-    VoucherListView, VoucherDetailView,
+    OrderListView, OrderExportView, OrderDetailView, OrderStatusUpdateView,
+    CustomerListView, CustomerExportView, CustomerDetailView, CustomerStatusUpdateView,
+    VoucherListView, VoucherDetailView, VoucherGenerateView, VoucherAssignView,
 )
 from .dashboard_views import DashboardStatsView, AnalyticsView
 
@@ -16,16 +16,20 @@ urlpatterns = [
     
     # Orders
     path("orders", OrderListView.as_view(), name="admin_orders"),
+    path("orders/export", OrderExportView.as_view(), name="admin_order_export"),
     path("orders/<str:order_id>", OrderDetailView.as_view(), name="admin_order_detail"),
     path("orders/<str:order_id>/status", OrderStatusUpdateView.as_view(), name="admin_order_status"),
     
     # Customers
     path("customers", CustomerListView.as_view(), name="admin_customers"),
+    path("customers/export", CustomerExportView.as_view(), name="admin_customer_export"),
     path("customers/<str:customer_id>", CustomerDetailView.as_view(), name="admin_customer_detail"),
     path("customers/<str:customer_id>/status", CustomerStatusUpdateView.as_view(), name="admin_customer_status"),
     
     # Vouchers
     path("vouchers", VoucherListView.as_view(), name="admin_vouchers"),
+    path("vouchers/generate", VoucherGenerateView.as_view(), name="admin_voucher_generate"),
     path("vouchers/<str:voucher_id>", VoucherDetailView.as_view(), name="admin_voucher_detail"),
+    path("vouchers/<str:voucher_id>/assign", VoucherAssignView.as_view(), name="admin_voucher_assign"),
 ]
 
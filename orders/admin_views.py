@@ -5,129 +5,243 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from users.auth import require_admin
+from common.jobs import enqueue
+from common.outbox import record_event
 from .models import Order, Voucher, UserVoucher
+from .checkout import cancel_order, order_status_changed_payload
+from .pagination import paginate_by_cursor
+from .voucher_cache import invalidate_voucher
+from .exports import (
+    CUSTOMER_EXPORT_COLUMNS, EXPORT_FORMATS, ORDER_EXPORT_COLUMNS,
+    customer_export_rows, order_export_rows, stream_export,
+)
+from .customer_stats import CUSTOMER_STATUSES, VIP_MIN_ORDERS, customer_status, customer_status_query
+from .voucher_campaigns import DEFAULT_CODE_LENGTH, MAX_CAMPAIGN_CODES, SEGMENTS
 from users.models import User
 from products.models import ChildCategory
-from bson import ObjectId
+import re
+from bson import DBRef, ObjectId
 from bson.errors import InvalidId
-from datetime import datetime, timedelta
+from datetime import datetime
 from mongoengine.queryset.visitor import Q
-from mongoengine.errors import ValidationError as MEValidationError, NotUniqueError
+from mongoengine.errors import DoesNotExist, ValidationError as MEValidationError, NotUniqueError
+from pymongo import ReturnDocument
+
+
+def _serialize_admin_order_rows(orders):
+    """Serialize admin order list rows; customers are fetched with one $in"""
+    user_ids = {order._data.get("user").id for order in orders if order._data.get("user")}
+    users = {user.id: user for user in User.objects(id__in=list(user_ids))} if user_ids else {}
+    result = []
+    for order in orders:
+        user_ref = order._data.get("user")
+        user = users.get(user_ref.id) if user_ref else None
+        result.append({
+            "id": str(order.id),
+            "orderNumber": order.order_number,
+            "customer": {
+                "id": str(user.id),
+                "name": user.displayName or user.email,
+                "email": user.email,
+                "phone": user.phone
+            } if user else None,
+            "total": order.total_price,
+            "status": order.status,
+            "paymentStatus": order.payment_status,
+            "orderDate": order.created_at.isoformat() if order.created_at else None,
+            "completedDate": order.completed_date.isoformat() if order.completed_date else None
+        })
+    return result
+
+
+_ADMIN_ORDER_SORT_FIELDS = {
+    "createdAt": "created_at",
+    "total": "total_price",
+    "status": "status",
+    "paymentStatus": "payment_status",
+}
+_ORDER_NUMBER_SEARCH = re.compile(r"^(?:ORD-?)?0*(\d+)$")
+MAX_SEARCH_CUSTOMERS = 1000
+
+
+def _order_search_query(search):
+    """
+    (Q, truncated) for the admin order search box.
+
+    An order number (ORD-000123, 000123, 123) matches order_seq exactly or
+    order_number by anchored prefix; anything else is looked up, case
+    insensitively, as the start of a customer's email, phone, username or
+    display name (User.search_keys). ``truncated`` is True when more than
+    MAX_SEARCH_CUSTOMERS customers matched and only the first ones are used.
+    """
+    term = search.strip()
+    clauses = []
+    match = _ORDER_NUMBER_SEARCH.match(term.upper())
+    if match:
+        clauses += [Q(order_seq=int(match.group(1))), Q(order_number__startswith=term.upper())]
+
+    user_query = {"role": "user", "search_keys": {"$regex": f"^{re.escape(term.lower())}"}}
+    user_ids = [
+        doc["_id"]
+        for doc in User._get_collection().find(user_query, {"_id": 1}).limit(MAX_SEARCH_CUSTOMERS + 1)
+    ]
+    truncated = len(user_ids) > MAX_SEARCH_CUSTOMERS
+    if user_ids:
+        clauses.append(Q(user__in=user_ids[:MAX_SEARCH_CUSTOMERS]))
+    if not clauses:
+        return Q(id=None), False  # Nothing can match
+    q = clauses[0]
+    for clause in clauses[1:]:
+        q = q | clause
+    return q, truncated
+
+
+def _admin_order_filter(params):
+    """(Q, search truncated) for the filters shared by the admin order list and export"""
+    search = (params.get("search") or "").strip()
+    status_filter = (params.get("status") or "").strip().lower()
+    payment_status = (params.get("paymentStatus") or "").strip().lower()
+    start_date = (params.get("startDate") or "").strip()
+    end_date = (params.get("endDate") or "").strip()
+
+    # Build base query
+    q = Q()
+
+    # Filter by date range
+    if start_date:
+        try:
+            dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
+            q = q & Q(created_at__gte=dt)
+        except Exception:
+            pass
+    if end_date:
+        try:
+            dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+            q = q & Q(created_at__lte=dt)
+        except Exception:
+            pass
+
+    if status_filter:
+        q = q & Q(status=status_filter)
+    if payment_status:
+        q = q & Q(payment_status=payment_status)
+
+    # Search: order number through order_seq / an anchored prefix,
+    # customers through indexed prefix lookups on users
+    search_truncated = False
+    if search:
+        search_q, search_truncated = _order_search_query(search)
+        q = q & search_q
+
+    return q, search_truncated
 
 
 class OrderListView(APIView):
-    """GET /api/admin/orders - List orders"""
+    """GET /api/admin/orders - List orders (page/limit, or cursor/limit with sort=createdAt)"""
     @require_admin
     def get(self, request):
         # Query params
         page = int(request.query_params.get("page", 1))
         limit = int(request.query_params.get("limit", 20))
         search = (request.query_params.get("search") or "").strip()
-        status_filter = (request.query_params.get("status") or "").strip().lower()
-        payment_status = (request.query_params.get("paymentStatus") or "").strip().lower()
-        start_date = (request.query_params.get("startDate") or "").strip()
-        end_date = (request.query_params.get("endDate") or "").strip()
         sort = (request.query_params.get("sort") or "createdAt").strip()
         order_dir = (request.query_params.get("order") or "desc").strip().lower()
 
-        # Build base query
-        q = Q()
+        q, search_truncated = _admin_order_filter(request.query_params)
+        qs = Order.objects(q)
 
-        # Filter by date range
-        if start_date:
-            try:
-                dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                q = q & Q(created_at__gte=dt)
-            except Exception:
-                pass
-        if end_date:
+        # Cursor mode: keyset pagination on (created_at, _id) done in Mongo
+        if "cursor" in request.query_params:
+            if sort != "createdAt":
+                return Response(
+                    {"error": {"code": "INVALID_PARAMETER", "message": "cursor only supports sort=createdAt"}},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             try:
-                dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                q = q & Q(created_at__lte=dt)
-            except Exception:
-                pass
+                page_items, next_cursor = paginate_by_cursor(
+                    qs, (request.query_params.get("cursor") or "").strip(), limit,
+                    descending=(order_dir != "asc")
+                )
+            except ValueError:
+                return Response(
+                    {"error": {"code": "INVALID_PARAMETER", "message": "Invalid cursor"}},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        if status_filter:
-            q = q & Q(status=status_filter)
-        if payment_status:
-            q = q & Q(payment_status=payment_status)
+            pagination = {"limit": limit, "nextCursor": next_cursor, "hasNext": next_cursor is not None}
+            if search_truncated:
+                pagination["searchTruncated"] = True
+            if (request.query_params.get("includeTotal") or "").lower() == "true":
+                pagination["total"] = qs.count()
+            elif not search and q.empty:
+                # Unfiltered: metadata-based count, no collection scan
+                pagination["total"] = Order._get_collection().estimated_document_count()
+                pagination["totalEstimated"] = True
 
-        # Execute initial query
-        qs = Order.objects(q)
+            return Response({"data": _serialize_admin_order_rows(page_items), "pagination": pagination})
 
-        # Search by orderNumber or customer info
-        if search:
-            # First, filter by order number contains
-            candidate_orders = list(qs.filter(order_number__icontains=search))
-            # Then, search by customer name/email/phone
-            user_q = (
-                Q(email__icontains=search) |
-                Q(displayName__icontains=search) |
-                Q(username__icontains=search) |
-                Q(phone__icontains=search)
-            )
-            matched_users = list(User.objects(user_q))
-            if matched_users:
-                user_ids = {u.id for u in matched_users}
-                candidate_orders += list(qs.filter(user__in=list(user_ids)))
-            # Deduplicate
-            seen = set()
-            orders = []
-            for o in candidate_orders:
-                if o.id not in seen:
-                    seen.add(o.id)
-                    orders.append(o)
-            qs_list = orders
-        else:
-            qs_list = list(qs)
-
-        # Sorting
-        reverse = (order_dir != "asc")
-        if sort == "total":
-            qs_list.sort(key=lambda x: x.total_price or 0, reverse=reverse)
-        elif sort == "status":
-            qs_list.sort(key=lambda x: x.status or "", reverse=reverse)
-        elif sort == "paymentStatus":
-            qs_list.sort(key=lambda x: x.payment_status or "", reverse=reverse)
-        else:  # createdAt default
-            qs_list.sort(key=lambda x: x.created_at or datetime.min, reverse=reverse)
-
-        # Pagination
-        total = len(qs_list)
+        # Sorting and pagination run in MongoDB; _id keeps pages stable on ties
+        prefix = "-" if order_dir != "asc" else ""
+        sort_field = _ADMIN_ORDER_SORT_FIELDS.get(sort, "created_at")
+        total = qs.count()
         start = (page - 1) * limit
         end = start + limit
-        page_items = qs_list[start:end]
+        page_items = list(qs.order_by(f"{prefix}{sort_field}", f"{prefix}id").skip(start).limit(limit))
 
-        # Build response
-        result = []
-        for order in page_items:
-            result.append({
-                "id": str(order.id),
-                "orderNumber": order.order_number,
-                "customer": {
-                    "id": str(order.user.id),
-                    "name": order.user.displayName or order.user.email,
-                    "email": order.user.email,
-                    "phone": order.user.phone
-                } if order.user else None,
-                "total": order.total_price,
-                "status": order.status,
-                "paymentStatus": order.payment_status,
-                "orderDate": order.created_at.isoformat() if order.created_at else None,
-                "completedDate": order.completed_date.isoformat() if order.completed_date else None
-            })
+        pagination = {
+            "page": page,
+            "limit": limit,
+            "total": total,
+            "totalPages": (total + limit - 1) // limit,
+            "hasNext": end < total,
+            "hasPrev": start > 0
+        }
+        if search_truncated:
+            pagination["searchTruncated"] = True
 
-        return Response({
-            "data": result,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total,
-                "totalPages": (total + limit - 1) // limit,
-                "hasNext": end < total,
-                "hasPrev": start > 0
-            }
-        })
+        return Response({"data": _serialize_admin_order_rows(page_items), "pagination": pagination})
+
+
+class OrderExportView(APIView):
+    """GET /api/admin/orders/export - Stream orders as CSV or NDJSON (same filters and sort as the list)"""
+    @require_admin
+    def get(self, request):
+        export_format = (request.query_params.get("fileFormat") or "csv").strip().lower()
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": {"code": "INVALID_PARAMETER", "message": "fileFormat must be csv or ndjson"}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        sort = (request.query_params.get("sort") or "createdAt").strip()
+        direction = 1 if (request.query_params.get("order") or "desc").strip().lower() == "asc" else -1
+        sort_field = _ADMIN_ORDER_SORT_FIELDS.get(sort, "created_at")
+
+        q, search_truncated = _admin_order_filter(request.query_params)
+        rows = order_export_rows(q.to_query(Order), [(sort_field, direction), ("_id", direction)])
+        response = stream_export(rows, ORDER_EXPORT_COLUMNS, export_format, f"orders-{datetime.utcnow():%Y%m%d-%H%M%S}")
+        if search_truncated:
+            response["X-Search-Truncated"] = "true"
+        return response
+
+
+def _serialize_admin_shipping_address(order):
+    """Prefer the checkout snapshot; older orders fall back to the Address"""
+    address = order.shipping_address
+    if not address:
+        try:
+            address = order.address
+        except DoesNotExist:
+            address = None
+    if not address or isinstance(address, DBRef):
+        return None
+    return {
+        "receiver": address.receiver,
+        "detail": address.detail,
+        "ward": address.ward,
+        "district": address.district,
+        "province": address.province,
+        "phone": address.phone
+    }
 
 
 class OrderDetailView(APIView):
@@ -172,14 +286,7 @@ class OrderDetailView(APIView):
             "status": order.status,
             "paymentMethod": order.payment_method,
             "paymentStatus": order.payment_status,
-            "shippingAddress": {
-                "receiver": order.address.receiver,
-                "detail": order.address.detail,
-                "ward": order.address.ward,
-                "district": order.address.district,
-                "province": order.address.province,
-                "phone": order.address.phone
-            } if order.address else None,
+            "shippingAddress": _serialize_admin_shipping_address(order),
             "orderDate": order.created_at.isoformat(),
             "completedDate": order.completed_date.isoformat() if order.completed_date else None,
             "notes": order.notes
@@ -216,9 +323,45 @@ class OrderStatusUpdateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update status
-        order.status = new_status
-        order.save()
+        if new_status == 'cancelled':
+            # Conditional transition: stock and voucher are restored only once
+            if not cancel_order(order, ['pending', 'processing', 'shipping']):
+                order.reload()
+                return Response(
+                    {"error": {"code": "INVALID_STATUS_TRANSITION",
+                              "message": f"Cannot change status from {order.status}"}},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            if new_status not in Order.status.choices:
+                return Response(
+                    {"error": {"code": "INVALID_STATUS", "message": f"Invalid status: {new_status}"}},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Conditional transition, like cancel_order: a concurrent
+            # cancellation (stock and voucher already restored) is not undone
+            now = datetime.utcnow()
+            changes = {"status": new_status, "updated_at": now}
+            if new_status == 'completed' and not order.completed_date:
+                changes["completed_date"] = now
+            updated = Order._get_collection().find_one_and_update(
+                {"_id": order.id, "status": current_status},
+                {"$set": changes},
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated is None:
+                order.reload()
+                return Response(
+                    {"error": {"code": "STATUS_CONFLICT",
+                              "message": f"Order status changed concurrently, it is now {order.status}"}},
+                    status=status.HTTP_409_CONFLICT
+                )
+            order = Order._from_son(updated)
+            if new_status != current_status:
+                record_event(
+                    "order.status_changed",
+                    order_status_changed_payload(order, current_status, order.status),
+                )
         
         return Response({
             "id": str(order.id),
@@ -228,90 +371,105 @@ class OrderStatusUpdateView(APIView):
         })
 
 
+_CUSTOMER_SORT_FIELDS = {
+    "totalOrders": "order_stats.total_orders",
+    "totalSpent": "order_stats.total_spent",
+    "joinDate": "created_at",
+}
+_CUSTOMER_LIST_FIELDS = {
+    "displayName": 1, "username": 1, "email": 1, "phone": 1, "avatar": 1,
+    "blocked": 1, "created_at": 1, "order_stats": 1,
+}
+
+
+def _customer_filter(params, now):
+    """
+    Raw users filter for the customer list and export: search and status
+    (active|inactive|vip|blocked). Raises ValueError for any other status.
+    """
+    search = (params.get("search") or "").strip()
+    status_filter = (params.get("status") or "").strip().lower()
+    if status_filter and status_filter not in CUSTOMER_STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(CUSTOMER_STATUSES)}")
+
+    # Base match: users only
+    match = {"role": "user"}
+    if status_filter:
+        match.update(customer_status_query(status_filter, now))
+    if search:
+        pattern = {"$regex": re.escape(search), "$options": "i"}
+        search_query = {"$or": [{"email": pattern}, {"username": pattern}, {"displayName": pattern}, {"phone": pattern}]}
+        match = {"$and": [match, search_query]}
+    return match
+
+
+def _customer_page(match, sort, direction, skip, limit):
+    """One page of raw user documents; stats sorts are served by (role, order_stats.*) indexes"""
+    users = User._get_collection()
+    if sort == "name":
+        # Display name falls back to username/email, so the key is computed
+        return list(users.aggregate([
+            {"$match": match},
+            {"$addFields": {"nameKey": {"$toLower": {
+                "$ifNull": ["$displayName", {"$ifNull": ["$username", {"$ifNull": ["$email", ""]}]}]
+            }}}},
+            {"$sort": {"nameKey": direction, "_id": direction}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": _CUSTOMER_LIST_FIELDS},
+        ], allowDiskUse=True))
+    sort_field = _CUSTOMER_SORT_FIELDS.get(sort)
+    order = [(sort_field, direction), ("_id", direction)] if sort_field else [("_id", 1)]
+    return list(users.find(match, _CUSTOMER_LIST_FIELDS).sort(order).skip(skip).limit(limit))
+
+
 class CustomerListView(APIView):
     """GET /api/admin/customers - List customers with stats"""
     @require_admin
     def get(self, request):
         # Query params
-        page = int(request.query_params.get("page", 1))
-        limit = int(request.query_params.get("limit", 20))
-        search = (request.query_params.get("search") or "").strip()
-        status_filter = (request.query_params.get("status") or "").strip().lower()  # active|inactive|vip|blocked
+        page = max(int(request.query_params.get("page", 1)), 1)
+        limit = max(int(request.query_params.get("limit", 20)), 1)
         sort = (request.query_params.get("sort") or "").strip()  # name|totalOrders|totalSpent|joinDate
         order_dir = (request.query_params.get("order") or "desc").strip().lower()  # asc|desc
 
-        # Base query: users only
-        query = Q(role="user")
-        if search:
-            query = query & (
-                Q(email__icontains=search) |
-                Q(username__icontains=search) |
-                Q(displayName__icontains=search) |
-                Q(phone__icontains=search)
-            )
-        if status_filter == "blocked":
-            query = query & Q(blocked=True)
-
-        users_qs = User.objects(query)
-
-        # Compute stats
-        results_with_stats = []
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        for user in users_qs:
-            orders_qs = Order.objects(user=user)
-            total_orders = orders_qs.count()
-            is_vip = total_orders > 10
-            recent_order = orders_qs.filter(created_at__gte=thirty_days_ago).order_by('-created_at').first()
-
-            if user.blocked:
-                customer_status = "blocked"
-            elif is_vip:
-                customer_status = "vip"
-            elif recent_order:
-                customer_status = "active"
-            else:
-                customer_status = "inactive"
-
-            completed_orders = orders_qs.filter(status="completed")
-            total_spent = sum(o.total_price for o in completed_orders)
-            avg_order_value = total_spent / total_orders if total_orders > 0 else 0
-
-            if status_filter and status_filter != "blocked" and customer_status != status_filter:
-                continue
-
-            results_with_stats.append({
-                "id": str(user.id),
-                "name": user.displayName or user.username or user.email,
-                "displayName": user.displayName,
-                "email": user.email,
-                "phone": user.phone,
-                "avatar": user.avatar,
+        now = datetime.utcnow()
+        try:
+            match = _customer_filter(request.query_params, now)
+        except ValueError as exc:
+            return Response(
+                {"error": {"code": "INVALID_PARAMETER", "message": str(exc)}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        start = (page - 1) * limit
+        docs = _customer_page(match, sort, 1 if order_dir == "asc" else -1, start, limit)
+        total = User._get_collection().count_documents(match)
+
+        paged = []
+        for doc in docs:
+            stats = doc.get("order_stats") or {}
+            total_orders = stats.get("total_orders", 0)
+            total_spent = stats.get("total_spent", 0)
+            last_order = stats.get("last_order_at")
+            joined = doc.get("created_at")
+            paged.append({
+                "id": str(doc["_id"]),
+                "name": doc.get("displayName") or doc.get("username") or doc.get("email"),
+                "displayName": doc.get("displayName"),
+                "email": doc.get("email"),
+                "phone": doc.get("phone"),
+                "avatar": doc.get("avatar"),
                 "totalOrders": total_orders,
                 "totalSpent": total_spent,
-                "averageOrderValue": avg_order_value,
-                "lastOrder": recent_order.created_at.isoformat() if recent_order else None,
-                "status": customer_status,
-                "isVip": is_vip,
-                "joinDate": user.created_at.isoformat()
+                "averageOrderValue": total_spent / total_orders if total_orders > 0 else 0,
+                "lastOrder": last_order.isoformat() if last_order else None,
+                "status": customer_status(doc, now),
+                "isVip": total_orders > VIP_MIN_ORDERS,
+                "joinDate": joined.isoformat() if joined else None
             })
 
-        # Sorting
-        reverse = (order_dir != "asc")
-        if sort == "name":
-            results_with_stats.sort(key=lambda x: (x["name"] or "").lower(), reverse=reverse)
-        elif sort == "totalOrders":
-            results_with_stats.sort(key=lambda x: x["totalOrders"], reverse=reverse)
-        elif sort == "totalSpent":
-            results_with_stats.sort(key=lambda x: x["totalSpent"], reverse=reverse)
-        elif sort == "joinDate":
-            results_with_stats.sort(key=lambda x: x["joinDate"] or "", reverse=reverse)
-
-        # Pagination
-        total = len(results_with_stats)
-        start = (page - 1) * limit
         end = start + limit
-        paged = results_with_stats[start:end]
-
         return Response({
             "data": paged,
             "pagination": {
@@ -325,6 +483,28 @@ class CustomerListView(APIView):
         })
 
 
+class CustomerExportView(APIView):
+    """GET /api/admin/customers/export - Stream customers with order stats as CSV or NDJSON"""
+    @require_admin
+    def get(self, request):
+        export_format = (request.query_params.get("fileFormat") or "csv").strip().lower()
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": {"code": "INVALID_PARAMETER", "message": "fileFormat must be csv or ndjson"}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        now = datetime.utcnow()
+        try:
+            match = _customer_filter(request.query_params, now)
+        except ValueError as exc:
+            return Response(
+                {"error": {"code": "INVALID_PARAMETER", "message": str(exc)}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        rows = customer_export_rows(match, now)
+        return stream_export(rows, CUSTOMER_EXPORT_COLUMNS, export_format, f"customers-{now:%Y%m%d-%H%M%S}")
+
+
 class CustomerDetailView(APIView):
     """GET /api/admin/customers/:id - Customer detail with order history"""
     @require_admin
@@ -337,33 +517,18 @@ class CustomerDetailView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Get customer orders
-        orders = Order.objects(user=user).order_by('-created_at')
-        total_orders = orders.count()
-        
-        # Calculate stats
-        completed_orders = orders.filter(status='completed')
-        total_spent = sum(order.total_price for order in completed_orders)
+        # Stats are materialized on the user (see orders/customer_stats.py)
+        stats = user.order_stats
+        total_orders = stats.total_orders if stats else 0
+        total_spent = stats.total_spent if stats else 0
         avg_order_value = total_spent / total_orders if total_orders > 0 else 0
-        
-        # Get first and last order
-        first_order = orders.order_by('created_at').first()
-        last_order = orders.order_by('-created_at').first()
-        
-        # Calculate status
-        is_vip = total_orders > 10
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_order = orders.filter(created_at__gte=thirty_days_ago).first()
-        
-        if user.blocked:
-            customer_status = "blocked"
-        elif is_vip:
-            customer_status = "vip"
-        elif recent_order:
-            customer_status = "active"
-        else:
-            customer_status = "inactive"
-        
+        first_order_at = stats.first_order_at if stats else None
+        last_order_at = stats.last_order_at if stats else None
+
+        is_vip = total_orders > VIP_MIN_ORDERS
+        status_value = customer_status(user.to_mongo(), datetime.utcnow())
+        orders = Order.objects(user=user).order_by('-created_at')
+
         # Get recent orders (last 10)
         recent_orders_data = []
         for order in orders[:10]:
@@ -403,8 +568,8 @@ class CustomerDetailView(APIView):
             "totalOrders": total_orders,
             "totalSpent": total_spent,
             "averageOrderValue": avg_order_value,
-            "lastOrder": last_order.created_at.isoformat() if last_order else None,
-            "status": customer_status,
+            "lastOrder": last_order_at.isoformat() if last_order_at else None,
+            "status": status_value,
             "isVip": is_vip,
             "joinDate": user.created_at.isoformat(),
             "orders": recent_orders_data,
@@ -412,8 +577,8 @@ class CustomerDetailView(APIView):
                 "totalOrders": total_orders,
                 "totalSpent": total_spent,
                 "averageOrderValue": avg_order_value,
-                "firstOrderDate": first_order.created_at.isoformat() if first_order else None,
-                "lastOrderDate": last_order.created_at.isoformat() if last_order else None
+                "firstOrderDate": first_order_at.isoformat() if first_order_at else None,
+                "lastOrderDate": last_order_at.isoformat() if last_order_at else None
             }
         })
 
@@ -473,6 +638,8 @@ def _serialize_voucher(voucher, include_categories_details=False):
         "start_date": voucher.start_date.isoformat() if voucher.start_date else None,
         "expired_date": voucher.expired_date.isoformat() if voucher.expired_date else None,
         "categories": [str(cat_id) for cat_id in voucher.categories] if voucher.categories else [],
+        "campaign": voucher.campaign,
+        "singleUse": bool(voucher.single_use),
         "createdAt": voucher.created_at.isoformat() if voucher.created_at else None,
         "updatedAt": voucher.updated_at.isoformat() if voucher.updated_at else None
     }
@@ -506,6 +673,19 @@ def _get_voucher_status(voucher):
     return "active"
 
 
+def _voucher_status_query(status_filter, now):
+    """Q matching vouchers whose _get_voucher_status(...) is ``status_filter``."""
+    started = Q(start_date=None) | Q(start_date__lte=now)
+    if status_filter == "upcoming":
+        return Q(start_date__gt=now)
+    if status_filter == "expired":
+        return started & Q(expired_date__lt=now)
+    if status_filter == "active":
+        return started & (Q(expired_date=None) | Q(expired_date__gte=now))
+    # Unknown status: nothing matches, as before
+    return Q(id=None)
+
+
 class VoucherListView(APIView):
     """GET /api/admin/vouchers - List vouchers
        POST /api/admin/vouchers - Create voucher"""
@@ -519,6 +699,8 @@ class VoucherListView(APIView):
             search = (request.query_params.get("search") or "").strip()
             status_filter = (request.query_params.get("status") or "").strip().lower()
             
+            campaign = (request.query_params.get("campaign") or "").strip()
+            
             # Build query
             q = Q()
             
@@ -526,25 +708,19 @@ class VoucherListView(APIView):
             if search:
                 q = q & (Q(name__icontains=search) | Q(code__icontains=search))
             
-            # Filter by status
-            vouchers = list(Voucher.objects(q))
+            if campaign:
+                q = q & Q(campaign=campaign)
+            
+            # Filter by status as date predicates (same rules as _get_voucher_status)
             if status_filter:
-                now = datetime.utcnow()
-                filtered = []
-                for v in vouchers:
-                    status = _get_voucher_status(v)
-                    if status == status_filter:
-                        filtered.append(v)
-                vouchers = filtered
-            
-            # Sort by created_at descending
-            vouchers.sort(key=lambda x: x.created_at or datetime.min, reverse=True)
-            
-            # Pagination
-            total = len(vouchers)
+                q = q & _voucher_status_query(status_filter, datetime.utcnow())
+            
+            # Sort, skip and limit run in MongoDB; _id breaks created_at ties
+            # (campaign codes are inserted in chunks sharing one created_at)
+            qs = Voucher.objects(q)
+            total = qs.count()
             start = (page - 1) * page_size
-            end = start + page_size
-            page_vouchers = vouchers[start:end]
+            page_vouchers = list(qs.order_by('-created_at', '-id').skip(start).limit(page_size))
             
             # Serialize
             result = [_serialize_voucher(v) for v in page_vouchers]
@@ -672,6 +848,8 @@ class VoucherListView(APIView):
                 categories=category_ids
             )
             voucher.save()
+            # A cached "unknown code" entry may now be wrong
+            invalidate_voucher()
             
             return Response(
                 _serialize_voucher(voucher),
@@ -819,6 +997,7 @@ class VoucherDetailView(APIView):
                 voucher.categories = category_ids
             
             voucher.save()
+            invalidate_voucher(voucher.id)
             
             return Response(_serialize_voucher(voucher, include_categories_details=True))
             
@@ -858,6 +1037,7 @@ class VoucherDetailView(APIView):
                 )
             
             voucher.delete()
+            invalidate_voucher(voucher.id)
             
             return Response(status=status.HTTP_204_NO_CONTENT)
             
@@ -872,3 +1052,138 @@ class VoucherDetailView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+
+
+def _parse_iso_datetime(value):
+    """Parse an ISO date string from the request; raises ValueError."""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+class VoucherGenerateView(APIView):
+    """POST /api/admin/vouchers/generate - Generate single-use campaign codes in the background"""
+    
+    @require_admin
+    def post(self, request):
+        try:
+            campaign = (request.data.get('campaign') or '').strip()
+            name = request.data.get('name')
+            discount = request.data.get('discount')
+            prefix = (request.data.get('prefix') or '').upper().strip()
+            
+            if not campaign:
+                return Response({"detail": "campaign là bắt buộc"}, status=status.HTTP_400_BAD_REQUEST)
+            if not name:
+                return Response({"detail": "name là bắt buộc"}, status=status.HTTP_400_BAD_REQUEST)
+            if discount is None or float(discount) < 0:
+                return Response({"detail": "discount phải >= 0"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                count = int(request.data.get('count'))
+                length = int(request.data.get('length', DEFAULT_CODE_LENGTH))
+            except (TypeError, ValueError):
+                return Response({"detail": "count và length phải là số nguyên"}, status=status.HTTP_400_BAD_REQUEST)
+            if not 1 <= count <= MAX_CAMPAIGN_CODES:
+                return Response(
+                    {"detail": f"count phải từ 1 đến {MAX_CAMPAIGN_CODES}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not 6 <= length <= 20:
+                return Response({"detail": "length phải từ 6 đến 20"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # A campaign name identifies one generation run (retries resume it)
+            if Voucher.objects(campaign=campaign).first():
+                return Response({"detail": "Campaign đã tồn tại"}, status=status.HTTP_409_CONFLICT)
+            
+            dates = {}
+            for field in ('start_date', 'expired_date'):
+                if request.data.get(field):
+                    try:
+                        dates[field] = _parse_iso_datetime(request.data[field])
+                    except ValueError:
+                        return Response({"detail": f"{field} không hợp lệ"}, status=status.HTTP_400_BAD_REQUEST)
+            if dates.get('start_date') and dates.get('expired_date') and dates['expired_date'] <= dates['start_date']:
+                return Response({"detail": "expired_date phải sau start_date"}, status=status.HTTP_400_BAD_REQUEST)
+            
+            category_ids = []
+            for cat_id in request.data.get('categories') or []:
+                try:
+                    category_ids.append(ObjectId(cat_id))
+                except (InvalidId, TypeError):
+                    pass
+            if category_ids:
+                category_ids = [c.id for c in ChildCategory.objects(id__in=category_ids).only('id')]
+            
+            template = {
+                "name": name,
+                "description": request.data.get('description', ''),
+                "discount": float(discount),
+                "min_value": float(request.data.get('min_value', 0)),
+                "start_date": dates['start_date'].isoformat() if dates.get('start_date') else None,
+                "expired_date": dates['expired_date'].isoformat() if dates.get('expired_date') else None,
+                "categories": [str(c) for c in category_ids],
+            }
+            job = enqueue(
+                "orders.generate_voucher_codes",
+                {"campaign": campaign, "count": count, "prefix": prefix, "length": length, "template": template},
+                dedupe_key=f"orders.generate_voucher_codes:{campaign}",
+            )
+            return Response(
+                {"jobId": str(job.id), "status": job.status, "campaign": campaign, "count": count},
+                status=status.HTTP_202_ACCEPTED
+            )
+            
+        except (TypeError, ValueError):
+            return Response({"detail": "Dữ liệu không hợp lệ"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {"detail": f"Đã xảy ra lỗi: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class VoucherAssignView(APIView):
+    """POST /api/admin/vouchers/:id/assign - Add a voucher to a customer segment's wallets in the background"""
+    
+    @require_admin
+    def post(self, request, voucher_id):
+        try:
+            voucher = Voucher.objects(id=ObjectId(voucher_id)).only('id', 'single_use').first()
+            if not voucher:
+                return Response({"detail": "Voucher không tồn tại"}, status=status.HTTP_404_NOT_FOUND)
+            if voucher.single_use:
+                return Response(
+                    {"detail": "Không thể gán voucher dùng một lần cho nhiều khách hàng"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            segment = (request.data.get('segment') or '').strip().lower()
+            user_ids = request.data.get('userIds') or []
+            if user_ids:
+                try:
+                    user_ids = [str(ObjectId(user_id)) for user_id in user_ids]
+                except (InvalidId, TypeError):
+                    return Response({"detail": "userIds không hợp lệ"}, status=status.HTTP_400_BAD_REQUEST)
+            elif segment not in SEGMENTS:
+                return Response(
+                    {"detail": f"segment phải là một trong: {', '.join(SEGMENTS)}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            job = enqueue(
+                "orders.assign_voucher",
+                {"voucher_id": str(voucher.id), "segment": segment or None, "user_ids": user_ids},
+            )
+            return Response(
+                {"jobId": str(job.id), "status": job.status, "voucherId": str(voucher.id), "segment": segment or None},
+                status=status.HTTP_202_ACCEPTED
+            )
+            
+        except InvalidId:
+            return Response({"detail": "Invalid voucher ID"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {"detail": f"Đã xảy ra lỗi: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
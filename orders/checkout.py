@@ -0,0 +1,194 @@
+"""
+Order write paths: checkout (reserve stock, insert the order, consume the
+voucher and clear the cart) and cancellation (give all of it back).
+
+Checkout has two modes, selected by ``settings.ORDER_CHECKOUT_MODE``:
+
+- ``sequential``: separate writes, compensating the stock reservation (and
+  deleting the order) if the order cannot be saved or the voucher was
+  redeemed concurrently. Works on a standalone mongod.
+- ``transaction``: all writes in one multi-document transaction, retried on
+  transient errors. Requires a replica set (a single-node one is enough).
+
+Both paths record ``order.created``/``order.status_changed`` outbox events
+(inside the transaction when there is one).
+"""
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine.connection import get_connection
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from common.outbox import dispatch_if_eager, record_event
+from .inventory import release_stock, reserve_stock
+from .models import Cart, Order, UserVoucher
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_MODE_SEQUENTIAL = "sequential"
+CHECKOUT_MODE_TRANSACTION = "transaction"
+
+
+class VoucherUnavailableError(Exception):
+    """Raised when the user's voucher was consumed by a concurrent checkout."""
+
+
+def place_order(order, cart, user_voucher=None, mode=None):
+    """
+    Persist a fully priced, unsaved ``order`` created from ``cart``.
+
+    Raises InsufficientStockError when stock runs out and
+    VoucherUnavailableError when the voucher is no longer active; in both
+    cases nothing is left written.
+    """
+    mode = mode or settings.ORDER_CHECKOUT_MODE
+    if mode == CHECKOUT_MODE_TRANSACTION:
+        return _place_order_in_transaction(order, cart, user_voucher)
+    return _place_order_sequential(order, cart, user_voucher)
+
+
+def _place_order_sequential(order, cart, user_voucher):
+    reserve_stock(order.items)
+
+    try:
+        order.save()
+    except Exception:
+        release_stock(order.items)
+        raise
+
+    if user_voucher:
+        # Conditional, as in the transaction path: only one checkout redeems it
+        result = UserVoucher._get_collection().update_one(
+            {"_id": user_voucher.id, "status": "active"},
+            {"$set": {"status": "used", "used_at": datetime.utcnow()}},
+        )
+        if result.modified_count == 0:
+            release_stock(order.items)
+            order.delete()
+            raise VoucherUnavailableError(str(user_voucher.id))
+        user_voucher.status = "used"
+
+    # Recorded once nothing can be rolled back any more
+    record_event("order.created", order_created_payload(order))
+
+    cart.products = []
+    cart.save()
+    return order
+
+
+def _place_order_in_transaction(order, cart, user_voucher):
+    # Order numbers come from the counters collection outside the
+    # transaction: a retried or aborted checkout only leaves a gap.
+    order.prepare_for_save()
+    order.validate()
+
+    def _write(session):
+        now = datetime.utcnow()
+        reserve_stock(order.items, session=session)
+
+        doc = order.to_mongo().to_dict()
+        doc.pop("_id", None)
+        inserted = Order._get_collection().insert_one(doc, session=session)
+        order.id = inserted.inserted_id
+        record_event("order.created", order_created_payload(order), session=session)
+
+        if user_voucher:
+            result = UserVoucher._get_collection().update_one(
+                {"_id": user_voucher.id, "status": "active"},
+                {"$set": {"status": "used", "used_at": now}},
+                session=session,
+            )
+            if result.matched_count == 0:
+                raise VoucherUnavailableError(str(user_voucher.id))
+
+        Cart._get_collection().update_one(
+            {"_id": cart.id},
+            {"$set": {"products": [], "updated_at": now}},
+            session=session,
+        )
+        return inserted.inserted_id
+
+    client = get_connection()
+    with client.start_session() as session:
+        order_id = session.with_transaction(
+            _write,
+            read_concern=ReadConcern("snapshot"),
+            write_concern=WriteConcern("majority"),
+        )
+
+    order.id = order_id
+    order._created = False
+    order._clear_changed_fields()
+    cart.products = []
+    dispatch_if_eager()
+    return order
+
+
+def _ref_id(value):
+    """ObjectId of a reference field value (document, DBRef or ObjectId)."""
+    return getattr(value, "id", value)
+
+
+def order_created_payload(order):
+    return {
+        "orderId": str(order.id),
+        "orderNumber": order.order_number,
+        "userId": str(_ref_id(order._data.get("user"))),
+        "status": order.status,
+        "total": order.total_price,
+        "createdAt": order.created_at.isoformat() if order.created_at else None,
+        "items": [
+            {"productId": str(item.product_id), "quantity": item.quantity}
+            for item in order.items
+        ],
+    }
+
+
+def order_status_changed_payload(order, from_status, to_status):
+    return {
+        "orderId": str(order.id),
+        "orderNumber": order.order_number,
+        "userId": str(_ref_id(order._data.get("user"))),
+        "from": from_status,
+        "to": to_status,
+        "total": order.total_price,
+        "createdAt": order.created_at.isoformat() if order.created_at else None,
+    }
+
+
+def cancel_order(order, from_statuses):
+    """
+    Cancel ``order`` if it is still in one of ``from_statuses``.
+
+    The status flip is a conditional update, so only one caller can win
+    it; only the winner returns stock/sold with one bulk write and gives the
+    voucher back. Returns True if this call cancelled the order.
+    """
+    now = datetime.utcnow()
+    previous = Order._get_collection().find_one_and_update(
+        {"_id": order.id, "status": {"$in": list(from_statuses)}},
+        {"$set": {"status": "cancelled", "updated_at": now}},
+        projection={"status": 1},
+    )
+    if previous is None:
+        return False
+    record_event("order.status_changed", order_status_changed_payload(order, previous["status"], "cancelled"))
+
+    release_stock(order.items)
+
+    if order.voucher:
+        voucher = order.voucher
+        expired = bool(getattr(voucher, "expired_date", None) and voucher.expired_date < now)
+        UserVoucher._get_collection().update_one(
+            {"user": _ref_id(order.user), "voucher": _ref_id(voucher), "status": "used"},
+            {
+                "$set": {"status": "expired" if expired else "active"},
+                "$unset": {"used_at": ""},
+            },
+        )
+
+    order.status = "cancelled"
+    order.updated_at = now
+    return True
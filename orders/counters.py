@@ -0,0 +1,131 @@
+"""
+Sequence generator backed by the ``counters`` collection.
+
+``find_one_and_update($inc)`` is atomic on the server, so concurrent
+checkouts in different gunicorn workers can never receive the same order
+number. With ``ORDER_NUMBER_BLOCK_SIZE > 1`` each process reserves a range
+of numbers per round trip and hands them out locally; numbers then stay
+unique but are no longer strictly increasing across processes and unused
+numbers of a block are skipped when the process exits.
+
+A missing order number counter is seeded on first use from the highest
+existing order number, so a database that already holds ``ORD-`` orders
+never gets numbers that collide with them.
+"""
+import threading
+
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .models import Counter, Order
+
+ORDER_NUMBER_COUNTER = "order_number"
+ORDER_NUMBER_PREFIX = "ORD-"
+
+
+def reserve_block(name, size=1, seed=None):
+    """
+    Atomically advance counter ``name`` by ``size``; return the first reserved value.
+
+    If the counter does not exist yet it is first raised to ``seed()`` (the
+    highest value already in use); concurrent seeders agree through $max.
+    """
+    collection = Counter._get_collection()
+    doc = collection.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": size}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        seed_counter(name, seed() if seed else 0)
+        doc = collection.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    return doc["seq"] - size + 1
+
+
+class BlockAllocator:
+    """Hands out values from locally reserved blocks of a named counter."""
+
+    def __init__(self, name, block_size=1, seed=None):
+        self.name = name
+        self.block_size = max(int(block_size), 1)
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0  # exclusive
+
+    def next(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._next = reserve_block(self.name, self.block_size, seed=self.seed)
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+            return value
+
+
+def highest_order_sequence():
+    """Highest numeric part of existing ORD- order numbers (0 when there are none)."""
+    collection = Order._get_collection()
+    latest = collection.find_one({"order_seq": {"$ne": None}}, {"order_seq": 1}, sort=[("order_seq", -1)])
+    highest = int(latest["order_seq"]) if latest else 0
+    # Orders saved before order_seq existed only carry the number
+    parsed = next(collection.aggregate([
+        {"$match": {"order_number": {"$regex": f"^{ORDER_NUMBER_PREFIX}"}, "order_seq": None}},
+        {"$project": {"seq": {"$convert": {
+            "input": {"$substrCP": ["$order_number", len(ORDER_NUMBER_PREFIX), 32]},
+            "to": "long",
+            "onError": None,
+            "onNull": None,
+        }}}},
+        {"$group": {"_id": None, "max_seq": {"$max": "$seq"}}},
+    ]), None)
+    if parsed and parsed.get("max_seq") is not None:
+        highest = max(highest, int(parsed["max_seq"]))
+    return highest
+
+
+_order_number_allocator = BlockAllocator(
+    ORDER_NUMBER_COUNTER,
+    getattr(settings, "ORDER_NUMBER_BLOCK_SIZE", 1),
+    seed=highest_order_sequence,
+)
+
+
+def next_order_sequence():
+    """Next numeric order sequence value."""
+    return _order_number_allocator.next()
+
+
+def format_order_number(seq):
+    return f"{ORDER_NUMBER_PREFIX}{seq:06d}"
+
+
+def next_order_number():
+    """Next order number such as ORD-000042."""
+    return format_order_number(next_order_sequence())
+
+
+def parse_order_number(order_number):
+    """Return the numeric part of an order number, or None if it is not ours."""
+    if not order_number or not order_number.startswith(ORDER_NUMBER_PREFIX):
+        return None
+    try:
+        return int(order_number[len(ORDER_NUMBER_PREFIX):])
+    except ValueError:
+        return None
+
+
+def seed_counter(name, value):
+    """Raise counter ``name`` to at least ``value`` (never moves it backwards)."""
+    doc = Counter._get_collection().find_one_and_update(
+        {"_id": name},
+        {"$max": {"seq": int(value)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["seq"]
@@ -0,0 +1,205 @@
+"""
+Per-customer order statistics materialized on ``User.order_stats``.
+
+Outbox handlers (orders/handlers.py) apply each order event as one
+conditional increment, so the admin customer list, customer detail,
+analytics segments and voucher segments read indexed fields instead of
+recounting orders. ``manage.py rebuild_customer_stats`` recomputes them
+from the orders collection (run it once when deploying, or after repairs).
+
+Events are at-least-once: the ids of recently applied events are kept on
+the user and checked before applying, and events older than the user's
+last rebuild are skipped because the rebuild already counted them.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from users.models import User
+from .models import Order
+
+VIP_MIN_ORDERS = 10
+ACTIVE_WINDOW = timedelta(days=30)
+CUSTOMER_STATUSES = ("blocked", "vip", "active", "inactive")
+
+APPLIED_EVENTS_KEPT = 50
+REBUILD_BATCH_SIZE = 1000
+
+
+def customer_status(user_doc, now):
+    """Status of a raw user document: blocked, vip, active or inactive."""
+    stats = user_doc.get("order_stats") or {}
+    if user_doc.get("blocked"):
+        return "blocked"
+    if stats.get("total_orders", 0) > VIP_MIN_ORDERS:
+        return "vip"
+    last_order_at = stats.get("last_order_at")
+    if last_order_at and last_order_at >= now - ACTIVE_WINDOW:
+        return "active"
+    return "inactive"
+
+
+def customer_status_query(status, now):
+    """Raw users filter matching ``customer_status(...) == status``."""
+    if status == "blocked":
+        return {"blocked": True}
+    not_blocked = {"blocked": {"$ne": True}}
+    active_since = now - ACTIVE_WINDOW
+    if status == "vip":
+        return {**not_blocked, "order_stats.total_orders": {"$gt": VIP_MIN_ORDERS}}
+    if status == "active":
+        return {
+            **not_blocked,
+            "order_stats.total_orders": {"$lte": VIP_MIN_ORDERS},
+            "order_stats.last_order_at": {"$gte": active_since},
+        }
+    if status == "inactive":
+        return {
+            **not_blocked,
+            "order_stats.total_orders": {"$not": {"$gt": VIP_MIN_ORDERS}},
+            "$or": [
+                {"order_stats.last_order_at": None},
+                {"order_stats.last_order_at": {"$lt": active_since}},
+            ],
+        }
+    return {}
+
+
+def customer_status_expression(now, include_blocked=True):
+    """
+    Aggregation expression of ``customer_status`` on a user document.
+    ``include_blocked=False`` classifies blocked users by their orders too.
+    """
+    branches = [
+        {"case": {"$gt": ["$order_stats.total_orders", VIP_MIN_ORDERS]}, "then": "vip"},
+        {"case": {"$gte": ["$order_stats.last_order_at", now - ACTIVE_WINDOW]}, "then": "active"},
+    ]
+    if include_blocked:
+        branches.insert(0, {"case": {"$eq": ["$blocked", True]}, "then": "blocked"})
+    return {"$switch": {"branches": branches, "default": "inactive"}}
+
+
+def segment_counts(now, include_blocked=True):
+    """
+    Customers per status plus ``total``, in one grouped aggregation over users.
+
+    With ``include_blocked=False`` there is no ``blocked`` bucket: blocked
+    users count as vip/active/inactive by their orders (the analytics
+    segments), so vip + active + inactive == total.
+    """
+    grouped = User._get_collection().aggregate([
+        {"$match": {"role": "user"}},
+        {"$group": {"_id": customer_status_expression(now, include_blocked), "count": {"$sum": 1}}},
+    ])
+    statuses = CUSTOMER_STATUSES if include_blocked else tuple(
+        status for status in CUSTOMER_STATUSES if status != "blocked"
+    )
+    counts = dict.fromkeys(statuses, 0)
+    counts.update({row["_id"]: row["count"] for row in grouped})
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+def _apply(event, inc=None, extra=None):
+    user_id = event["payload"].get("userId")
+    if not user_id or user_id == "None":
+        return
+    event_id = event["id"]
+    applied_at = event.get("created_at") or datetime.utcnow()
+    update = {
+        "$push": {"order_stats.applied_events": {"$each": [event_id], "$slice": -APPLIED_EVENTS_KEPT}},
+        **(extra or {}),
+    }
+    if inc:
+        update["$inc"] = inc
+    User._get_collection().update_one(
+        {
+            "_id": ObjectId(user_id),
+            "order_stats.applied_events": {"$ne": event_id},
+            "$or": [
+                {"order_stats.rebuilt_at": {"$exists": False}},
+                {"order_stats.rebuilt_at": {"$lt": applied_at}},
+            ],
+        },
+        update,
+    )
+
+
+def apply_order_created(event):
+    payload = event["payload"]
+    created_at = payload.get("createdAt")
+    created_at = datetime.fromisoformat(created_at) if created_at else event.get("created_at") or datetime.utcnow()
+    total = payload.get("total") or 0
+    _apply(
+        event,
+        inc={
+            "order_stats.total_orders": 1,
+            "order_stats.total_spent": total if payload.get("status") == "completed" else 0,
+        },
+        extra={
+            "$min": {"order_stats.first_order_at": created_at},
+            "$max": {"order_stats.last_order_at": created_at},
+        },
+    )
+
+
+def apply_order_status_changed(event):
+    payload = event["payload"]
+    total = payload.get("total") or 0
+    delta = 0
+    if payload.get("to") == "completed":
+        delta += total
+    if payload.get("from") == "completed":
+        delta -= total
+    if delta:
+        _apply(event, inc={"order_stats.total_spent": delta})
+
+
+def _stats_for(user_ids):
+    grouped = Order._get_collection().aggregate([
+        {"$match": {"user": {"$in": user_ids}}},
+        {"$group": {
+            "_id": "$user",
+            "total_orders": {"$sum": 1},
+            "total_spent": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, "$total_price", 0]}},
+            "first_order_at": {"$min": "$created_at"},
+            "last_order_at": {"$max": "$created_at"},
+        }},
+    ])
+    return {doc.pop("_id"): doc for doc in grouped}
+
+
+def rebuild_customer_stats(batch_size=REBUILD_BATCH_SIZE, on_progress=None):
+    """
+    Recompute ``order_stats`` for every customer, ``batch_size`` users at a time.
+
+    Each batch records when its snapshot was taken; events created before
+    that are then ignored by the handlers. An order committed while its
+    batch is being read can still be missed, so rebuild when traffic is low.
+    """
+    users = User._get_collection()
+    processed = 0
+    last_id = None
+    while True:
+        query = {"role": "user"}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        user_ids = [doc["_id"] for doc in users.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        if not user_ids:
+            break
+        snapshot = datetime.utcnow()
+        stats = _stats_for(user_ids)
+        operations = []
+        for user_id in user_ids:
+            row = stats.get(user_id) or {"total_orders": 0, "total_spent": 0}
+            # No null order dates: $min would keep a null over any later date
+            order_stats = {key: value for key, value in row.items() if value is not None}
+            order_stats.update(rebuilt_at=snapshot, applied_events=[])
+            operations.append(UpdateOne({"_id": user_id}, {"$set": {"order_stats": order_stats}}))
+        users.bulk_write(operations, ordered=False)
+        processed += len(user_ids)
+        last_id = user_ids[-1]
+        if on_progress:
+            on_progress({"processed": processed})
+    return {"processed": processed}
@@ -6,141 +6,318 @@ from rest_framework.response import Response
 from rest_framework import status
 from users.auth import require_admin
 from .models import Order
+from .customer_stats import segment_counts
+from . import sales_rollups
+from django.conf import settings
+from common.cache import StaleWhileRevalidateCache
 from users.models import User
 from products.models import Product, ParentCategory, ChildCategory
 from datetime import datetime, timedelta
 from bson import ObjectId
 
 
+def _order_totals(prev_start, start_date):
+    """Order count and completed revenue for [prev_start, start_date) and [start_date, now)"""
+    grouped = Order._get_collection().aggregate([
+        {"$match": {"created_at": {"$gte": prev_start}}},
+        {"$group": {
+            "_id": {"$gte": ["$created_at", start_date]},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, "$total_price", 0]}},
+        }},
+    ])
+    totals = {"current": {"orders": 0, "revenue": 0}, "previous": {"orders": 0, "revenue": 0}}
+    for row in grouped:
+        totals["current" if row["_id"] else "previous"] = {"orders": row["orders"], "revenue": row["revenue"]}
+    return totals
+
+
+PERIODS = ("week", "month", "year")
+
+# Admin dashboards auto-refresh: serve recent results and recompute once in the background
+_dashboard_stats_cache = StaleWhileRevalidateCache(
+    "dashboard_stats",
+    ttl=settings.DASHBOARD_CACHE_TTL_SECONDS,
+    max_stale=settings.DASHBOARD_CACHE_MAX_STALE_SECONDS,
+)
+_analytics_cache = StaleWhileRevalidateCache(
+    "analytics",
+    ttl=settings.DASHBOARD_CACHE_TTL_SECONDS,
+    max_stale=settings.DASHBOARD_CACHE_MAX_STALE_SECONDS,
+)
+
+
+def _cached_response(cache, period, compute):
+    """Response for ``period`` from ``cache``, with when it was computed"""
+    period = period if period in PERIODS else 'month'
+    data, generated_at = cache.get(period, lambda: compute(period))
+    age = max(int((datetime.utcnow() - generated_at).total_seconds()), 0)
+    response = Response({**data, "cache": {"generatedAt": generated_at.isoformat(), "ageSeconds": age}})
+    response["Age"] = str(age)
+    return response
+
+
+def _use_rollups(start, end):
+    """Read daily_sales for [start, end) when enabled and every day is rolled up"""
+    return getattr(settings, "ANALYTICS_USE_ROLLUPS", False) and sales_rollups.covers(start, end)
+
+
+def _rollup_bounds(now, start_date):
+    """
+    Whole-day bounds (prev_start, start, end) for a rolling period starting
+    at ``start_date``: rollups cover the last N days including today.
+    """
+    days = (now - start_date).days
+    end = sales_rollups.day_start(now) + sales_rollups.ONE_DAY
+    start = end - timedelta(days=days)
+    return start - timedelta(days=days), start, end
+
+
+def _top_products(start_date, limit=10):
+    """Best-selling products by revenue of completed orders since ``start_date``"""
+    rows = Order._get_collection().aggregate([
+        {"$match": {"status": "completed", "created_at": {"$gte": start_date}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": "$items.product_id",
+            "productName": {"$first": "$items.product_name"},
+            "sales": {"$sum": "$items.quantity"},
+            "revenue": {"$sum": "$items.total"},
+        }},
+        {"$sort": {"revenue": -1}},
+        {"$limit": limit},
+    ], allowDiskUse=True)
+    return [{"productId": str(row.pop("_id")), **row} for row in rows]
+
+
+def _chart_buckets(period, now):
+    """Bucket start dates (oldest first) and the $dateTrunc unit of the revenue chart"""
+    if period == 'year':
+        month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        buckets = []
+        for _ in range(12):
+            buckets.insert(0, month)
+            month = (month - timedelta(days=1)).replace(day=1)
+        return buckets, "month"
+    days = 7 if period == 'week' else 30
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [today - timedelta(days=i) for i in range(days - 1, -1, -1)], "day"
+
+
+def _completed_by_bucket(start, unit):
+    """{bucket start: (revenue, orders)} of completed orders since ``start``"""
+    grouped = Order._get_collection().aggregate([
+        {"$match": {"status": "completed", "created_at": {"$gte": start}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$created_at", "unit": unit}},
+            "revenue": {"$sum": "$total_price"},
+            "orders": {"$sum": 1},
+        }},
+    ])
+    return {row["_id"]: (row["revenue"], row["orders"]) for row in grouped}
+
+
+def _revenue_chart(period, now):
+    buckets, unit = _chart_buckets(period, now)
+    use_rollups = _use_rollups(buckets[0], sales_rollups.day_start(now) + sales_rollups.ONE_DAY)
+    load = sales_rollups.completed_by_bucket if use_rollups else _completed_by_bucket
+    by_bucket = load(buckets[0], unit)
+    chart = []
+    for bucket in buckets:
+        revenue, orders = by_bucket.get(bucket, (0, 0))
+        if unit == "month":
+            chart.append({"month": bucket.strftime("T%m"), "revenue": revenue, "orders": orders})
+        else:
+            chart.append({"date": bucket.strftime("%Y-%m-%d"), "revenue": revenue, "orders": orders})
+    return chart
+
+
+def _category_distribution():
+    """Product count per parent category: one grouped count, then a name lookup"""
+    counts = Product._get_collection().aggregate([
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+    ])
+    counts = {row["_id"]: row["count"] for row in counts if row["_id"] is not None}
+    if not counts:
+        return []
+    children = ChildCategory._get_collection().find({"_id": {"$in": list(counts)}}, {"parent": 1})
+    per_parent = {}
+    for child in children:
+        if child.get("parent") is not None:
+            per_parent[child["parent"]] = per_parent.get(child["parent"], 0) + counts[child["_id"]]
+    distribution = []
+    for parent in ParentCategory._get_collection().find({}, {"name": 1}):
+        product_count = per_parent.get(parent["_id"], 0)
+        if product_count > 0:
+            distribution.append({"name": parent.get("name"), "value": product_count, "count": product_count})
+    return distribution
+
+
+def _compute_dashboard_stats(period):
+    """Body of GET /api/admin/dashboard/stats for ``period``"""
+    # Calculate date range
+    now = datetime.utcnow()
+    if period == 'week':
+        start_date = now - timedelta(days=7)
+        prev_start = start_date - timedelta(days=7)
+    elif period == 'year':
+        start_date = now - timedelta(days=365)
+        prev_start = start_date - timedelta(days=365)
+    else:  # month (default)
+        start_date = now - timedelta(days=30)
+        prev_start = start_date - timedelta(days=30)
+    
+    # Current and previous period totals in one pass
+    rollup_bounds = _rollup_bounds(now, start_date)
+    use_rollups = _use_rollups(rollup_bounds[0], rollup_bounds[2])
+    if use_rollups:
+        totals = sales_rollups.period_totals(*rollup_bounds)
+    else:
+        totals = _order_totals(prev_start, start_date)
+    total_revenue = totals["current"]["revenue"]
+    prev_revenue = totals["previous"]["revenue"]
+    revenue_change = ((total_revenue - prev_revenue) / prev_revenue * 100) if prev_revenue > 0 else 0
+    
+    total_orders = totals["current"]["orders"]
+    prev_total_orders = totals["previous"]["orders"]
+    orders_change = ((total_orders - prev_total_orders) / prev_total_orders * 100) if prev_total_orders > 0 else 0
+    
+    # Calculate customers
+    total_customers = User.objects(role='user').count()
+    # New customers in period
+    if use_rollups:
+        new_customers = totals["current"]["new_customers"]
+        prev_new_customers = totals["previous"]["new_customers"]
+    else:
+        new_customers = User.objects(role='user', created_at__gte=start_date).count()
+        prev_new_customers = User.objects(role='user', created_at__gte=prev_start, created_at__lt=start_date).count()
+    customers_change = ((new_customers - prev_new_customers) / prev_new_customers * 100) if prev_new_customers > 0 else 0
+    
+    # Calculate products
+    total_products = Product.objects.count()
+    new_products = Product.objects(created_at__gte=start_date).count()
+    prev_new_products = Product.objects(created_at__gte=prev_start, created_at__lt=start_date).count()
+    products_change = ((new_products - prev_new_products) / prev_new_products * 100) if prev_new_products > 0 else 0
+    
+    # Get recent orders (customers fetched with one $in)
+    recent_orders = list(Order.objects.all().order_by('-created_at')[:10])
+    user_ids = {order._data.get("user").id for order in recent_orders if order._data.get("user")}
+    users = {user.id: user for user in User.objects(id__in=list(user_ids)).only("displayName", "email")} if user_ids else {}
+    recent_orders_data = []
+    for order in recent_orders:
+        user_ref = order._data.get("user")
+        user = users.get(user_ref.id) if user_ref else None
+        recent_orders_data.append({
+            "id": str(order.id),
+            "orderNumber": order.order_number,
+            "customer": user.displayName or user.email if user else "Unknown",
+            "product": order.items[0].product_name if order.items else "N/A",
+            "amount": order.total_price,
+            "status": order.status,
+            "date": order.created_at.isoformat()
+        })
+    
+    # Revenue chart: daily for week/month, monthly for year
+    revenue_chart = _revenue_chart(period, now)
+    
+    # Category distribution
+    category_distribution = _category_distribution()
+    
+    return {
+        "summary": {
+            "totalRevenue": total_revenue,
+            "revenueChange": round(revenue_change, 1),
+            "totalOrders": total_orders,
+            "ordersChange": round(orders_change, 1),
+            "totalCustomers": total_customers,
+            "customersChange": round(customers_change, 1),
+            "totalProducts": total_products,
+            "productsChange": round(products_change, 1)
+        },
+        "recentOrders": recent_orders_data,
+        "revenueChart": revenue_chart[:12],  # Limit to 12 data points
+        "categoryDistribution": category_distribution
+    }
+
+
 class DashboardStatsView(APIView):
     """GET /api/admin/dashboard/stats - Dashboard statistics"""
     
     @require_admin
     def get(self, request):
-        # Get period from query params
-        period = request.query_params.get('period', 'month')
-        
-        # Calculate date range
-        now = datetime.utcnow()
-        if period == 'week':
-            start_date = now - timedelta(days=7)
-            prev_start = start_date - timedelta(days=7)
-        elif period == 'year':
-            start_date = now - timedelta(days=365)
-            prev_start = start_date - timedelta(days=365)
-        else:  # month (default)
-            start_date = now - timedelta(days=30)
-            prev_start = start_date - timedelta(days=30)
-        
-        # Current period orders
-        current_orders = Order.objects(created_at__gte=start_date)
-        completed_orders = current_orders.filter(status='completed')
-        
-        # Previous period orders (for comparison)
-        prev_orders = Order.objects(created_at__gte=prev_start, created_at__lt=start_date)
-        prev_completed_orders = prev_orders.filter(status='completed')
-        
-        # Calculate revenue
-        total_revenue = sum(order.total_price for order in completed_orders)
-        prev_revenue = sum(order.total_price for order in prev_completed_orders)
-        revenue_change = ((total_revenue - prev_revenue) / prev_revenue * 100) if prev_revenue > 0 else 0
-        
-        # Calculate orders count
-        total_orders = current_orders.count()
-        prev_total_orders = prev_orders.count()
-        orders_change = ((total_orders - prev_total_orders) / prev_total_orders * 100) if prev_total_orders > 0 else 0
-        
-        # Calculate customers
-        total_customers = User.objects(role='user').count()
-        # New customers in period
+        return _cached_response(_dashboard_stats_cache, request.query_params.get('period', 'month'), _compute_dashboard_stats)
+
+
+def _compute_analytics(period):
+    """Body of GET /api/admin/analytics for ``period``"""
+    # Calculate date range
+    now = datetime.utcnow()
+    if period == 'week':
+        start_date = now - timedelta(days=7)
+    elif period == 'year':
+        start_date = now - timedelta(days=365)
+    else:  # month
+        start_date = now - timedelta(days=30)
+    
+    _, rollup_start, rollup_end = _rollup_bounds(now, start_date)
+    if _use_rollups(rollup_start, rollup_end):
+        totals = sales_rollups.period_totals(rollup_start, rollup_start, rollup_end)["current"]
+        total_revenue = totals["revenue"]
+        total_orders = totals["orders"]
+        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
+        new_customers = totals["new_customers"]
+        top_products = sales_rollups.top_products(rollup_start, rollup_end)
+    else:
+        totals = _order_totals(start_date, start_date)["current"]
+        total_revenue = totals["revenue"]
+        total_orders = totals["orders"]
+        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
         new_customers = User.objects(role='user', created_at__gte=start_date).count()
-        prev_new_customers = User.objects(role='user', created_at__gte=prev_start, created_at__lt=start_date).count()
-        customers_change = ((new_customers - prev_new_customers) / prev_new_customers * 100) if prev_new_customers > 0 else 0
-        
-        # Calculate products
-        total_products = Product.objects.count()
-        new_products = Product.objects(created_at__gte=start_date).count()
-        prev_new_products = Product.objects(created_at__gte=prev_start, created_at__lt=start_date).count()
-        products_change = ((new_products - prev_new_products) / prev_new_products * 100) if prev_new_products > 0 else 0
-        
-        # Get recent orders
-        recent_orders = Order.objects.all().order_by('-created_at')[:10]
-        recent_orders_data = []
-        for order in recent_orders:
-            recent_orders_data.append({
-                "id": str(order.id),
-                "orderNumber": order.order_number,
-                "customer": order.user.displayName or order.user.email if order.user else "Unknown",
-                "product": order.items[0].product_name if order.items else "N/A",
-                "amount": order.total_price,
-                "status": order.status,
-                "date": order.created_at.isoformat()
-            })
-        
-        # Revenue chart data (by day for the period)
-        revenue_chart = []
-        days_in_period = 7 if period == 'week' else 30 if period == 'month' else 12
-        
-        for i in range(days_in_period):
-            if period == 'year':
-                # Monthly data for year
-                month_start = now.replace(day=1) - timedelta(days=30 * i)
-                month_end = month_start + timedelta(days=30)
-                orders_in_period = Order.objects(
-                    status='completed',
-                    created_at__gte=month_start,
-                    created_at__lt=month_end
-                )
-                period_revenue = sum(o.total_price for o in orders_in_period)
-                revenue_chart.insert(0, {
-                    "month": month_start.strftime("T%m"),
-                    "revenue": period_revenue,
-                    "orders": orders_in_period.count()
-                })
-            else:
-                # Daily data for week/month
-                day_start = now.replace(hour=0, minute=0, second=0) - timedelta(days=i)
-                day_end = day_start + timedelta(days=1)
-                orders_in_day = Order.objects(
-                    status='completed',
-                    created_at__gte=day_start,
-                    created_at__lt=day_end
-                )
-                day_revenue = sum(o.total_price for o in orders_in_day)
-                revenue_chart.insert(0, {
-                    "date": day_start.strftime("%Y-%m-%d"),
-                    "revenue": day_revenue,
-                    "orders": orders_in_day.count()
-                })
-        
-        # Category distribution
-        category_distribution = []
-        parent_categories = ParentCategory.objects.all()
-        for parent in parent_categories:
-            children = ChildCategory.objects(parent=parent)
-            product_count = Product.objects(category__in=children).count()
-            if product_count > 0:
-                category_distribution.append({
-                    "name": parent.name,
-                    "value": product_count,
-                    "count": product_count
-                })
-        
-        return Response({
-            "summary": {
-                "totalRevenue": total_revenue,
-                "revenueChange": round(revenue_change, 1),
-                "totalOrders": total_orders,
-                "ordersChange": round(orders_change, 1),
-                "totalCustomers": total_customers,
-                "customersChange": round(customers_change, 1),
-                "totalProducts": total_products,
-                "productsChange": round(products_change, 1)
+        top_products = _top_products(start_date)
+    
+    # Customer segments (materialized order stats, see orders/customer_stats.py);
+    # blocked customers are classified by their orders, so segments add up to total
+    segments = segment_counts(now, include_blocked=False)
+    vip_count = segments["vip"]
+    active_count = segments["active"]
+    inactive_count = segments["inactive"]
+    total_users = segments["total"]
+    
+    return {
+        "summary": {
+            "totalRevenue": total_revenue,
+            "totalOrders": total_orders,
+            "newCustomers": new_customers,
+            "averageOrderValue": round(avg_order_value, 0)
+        },
+        "topProducts": top_products,
+        "customerSegments": [
+            {
+                "segment": "new",
+                "name": "Khách mới",
+                "count": new_customers,
+                "percentage": round(new_customers / total_users * 100, 1) if total_users > 0 else 0
             },
-            "recentOrders": recent_orders_data,
-            "revenueChart": revenue_chart[:12],  # Limit to 12 data points
-            "categoryDistribution": category_distribution
-        })
+            {
+                "segment": "regular",
+                "name": "Khách thường xuyên",
+                "count": active_count,
+                "percentage": round(active_count / total_users * 100, 1) if total_users > 0 else 0
+            },
+            {
+                "segment": "vip",
+                "name": "Khách VIP",
+                "count": vip_count,
+                "percentage": round(vip_count / total_users * 100, 1) if total_users > 0 else 0
+            },
+            {
+                "segment": "inactive",
+                "name": "Không hoạt động",
+                "count": inactive_count,
+                "percentage": round(inactive_count / total_users * 100, 1) if total_users > 0 else 0
+            }
+        ]
+    }
 
 
 class AnalyticsView(APIView):
@@ -148,100 +325,4 @@ class AnalyticsView(APIView):
     
     @require_admin
     def get(self, request):
-        # Get period from query params
-        period = request.query_params.get('period', 'month')
-        
-        # Calculate date range
-        now = datetime.utcnow()
-        if period == 'week':
-            start_date = now - timedelta(days=7)
-        elif period == 'year':
-            start_date = now - timedelta(days=365)
-        else:  # month
-            start_date = now - timedelta(days=30)
-        
-        # Get orders in period
-        period_orders = Order.objects(created_at__gte=start_date)
-        completed_orders = period_orders.filter(status='completed')
-        
-        # Calculate summary
-        total_revenue = sum(order.total_price for order in completed_orders)
-        total_orders = period_orders.count()
-        avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-        
-        # New customers
-        new_customers = User.objects(role='user', created_at__gte=start_date).count()
-        
-        # Top products
-        product_sales = {}
-        for order in completed_orders:
-            for item in order.items:
-                pid = str(item.product_id)
-                if pid not in product_sales:
-                    product_sales[pid] = {
-                        "productId": pid,
-                        "productName": item.product_name,
-                        "sales": 0,
-                        "revenue": 0
-                    }
-                product_sales[pid]["sales"] += item.quantity
-                product_sales[pid]["revenue"] += item.total
-        
-        top_products = sorted(product_sales.values(), key=lambda x: x["revenue"], reverse=True)[:10]
-        
-        # Customer segments
-        all_users = User.objects(role='user')
-        vip_count = 0
-        active_count = 0
-        inactive_count = 0
-        
-        thirty_days_ago = now - timedelta(days=30)
-        for user in all_users:
-            user_orders = Order.objects(user=user).count()
-            if user_orders > 10:
-                vip_count += 1
-            else:
-                recent_order = Order.objects(user=user, created_at__gte=thirty_days_ago).first()
-                if recent_order:
-                    active_count += 1
-                else:
-                    inactive_count += 1
-        
-        total_users = all_users.count()
-        
-        return Response({
-            "summary": {
-                "totalRevenue": total_revenue,
-                "totalOrders": total_orders,
-                "newCustomers": new_customers,
-                "averageOrderValue": round(avg_order_value, 0)
-            },
-            "topProducts": top_products,
-            "customerSegments": [
-                {
-                    "segment": "new",
-                    "name": "Khách mới",
-                    "count": new_customers,
-                    "percentage": round(new_customers / total_users * 100, 1) if total_users > 0 else 0
-                },
-                {
-                    "segment": "regular",
-                    "name": "Khách thường xuyên",
-                    "count": active_count,
-                    "percentage": round(active_count / total_users * 100, 1) if total_users > 0 else 0
-                },
-                {
-                    "segment": "vip",
-                    "name": "Khách VIP",
-                    "count": vip_count,
-                    "percentage": round(vip_count / total_users * 100, 1) if total_users > 0 else 0
-                },
-                {
-                    "segment": "inactive",
-                    "name": "Không hoạt động",
-                    "count": inactive_count,
-                    "percentage": round(inactive_count / total_users * 100, 1) if total_users > 0 else 0
-                }
-            ]
-        })
-
+        return _cached_response(_analytics_cache, request.query_params.get('period', 'month'), _compute_analytics)
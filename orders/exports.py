@@ -0,0 +1,170 @@
+"""
+Streaming CSV / NDJSON exports for the admin.
+
+Rows are read from a server-side cursor (projection + batch_size) and
+written to the response as they arrive, so memory stays flat whatever the
+number of rows. Related documents are resolved per batch with one $in.
+"""
+import csv
+import json
+from itertools import islice
+
+from bson import DBRef
+from django.http import StreamingHttpResponse
+
+from users.models import User
+from .customer_stats import VIP_MIN_ORDERS, customer_status_expression
+from .models import Order
+
+EXPORT_FORMATS = ("csv", "ndjson")
+BATCH_SIZE = 1000
+# Spreadsheet apps run a cell starting with these as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+ORDER_EXPORT_COLUMNS = [
+    "orderNumber", "orderDate", "status", "paymentStatus", "paymentMethod",
+    "customerId", "customerName", "customerEmail", "customerPhone",
+    "items", "subtotal", "shippingFee", "discount", "vat", "total", "completedDate",
+]
+CUSTOMER_EXPORT_COLUMNS = [
+    "id", "name", "email", "phone", "joinDate", "status", "isVip",
+    "totalOrders", "totalSpent", "averageOrderValue", "firstOrder", "lastOrder",
+]
+_ORDER_PROJECTION = {
+    "order_number": 1, "user": 1, "status": 1, "payment_status": 1, "payment_method": 1,
+    "items.quantity": 1, "subtotal": 1, "shipping_fee": 1, "discount": 1, "vat": 1,
+    "total_price": 1, "created_at": 1, "completed_date": 1,
+}
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    """``value`` for a CSV cell: text that would be read as a formula gets a leading quote"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _ref_id(value):
+    return value.id if isinstance(value, DBRef) else value
+
+
+def batches(cursor, size=BATCH_SIZE):
+    """Yield lists of up to ``size`` documents from ``cursor``"""
+    cursor = iter(cursor)
+    while True:
+        batch = list(islice(cursor, size))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_export(rows, columns, export_format, filename):
+    """
+    StreamingHttpResponse writing ``rows`` (dicts) as CSV with ``columns``, or
+    NDJSON. CSV cells are escaped against formula injection (csv_cell);
+    NDJSON values are written as they are.
+    """
+    if export_format == "ndjson":
+        content = (json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows)
+        content_type = "application/x-ndjson"
+    else:
+        writer = csv.writer(_Echo())
+
+        def csv_lines():
+            yield "\ufeff"  # BOM: spreadsheet apps then read the Vietnamese text as UTF-8
+            yield writer.writerow(columns)
+            for row in rows:
+                yield writer.writerow([csv_cell(row.get(column)) for column in columns])
+
+        content = csv_lines()
+        content_type = "text/csv; charset=utf-8"
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{export_format}"'
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def order_export_rows(query, sort):
+    """Export rows of the orders matching raw ``query``, customers looked up per batch"""
+    cursor = Order._get_collection().find(query, _ORDER_PROJECTION, sort=sort, batch_size=BATCH_SIZE)
+    users = User._get_collection()
+    for batch in batches(cursor):
+        user_ids = list({_ref_id(doc["user"]) for doc in batch if doc.get("user")})
+        customers = {
+            user["_id"]: user
+            for user in users.find({"_id": {"$in": user_ids}}, {"displayName": 1, "email": 1, "phone": 1})
+        }
+        for doc in batch:
+            user_id = _ref_id(doc.get("user"))
+            customer = customers.get(user_id, {})
+            yield {
+                "orderNumber": doc.get("order_number"),
+                "orderDate": _isoformat(doc.get("created_at")),
+                "status": doc.get("status"),
+                "paymentStatus": doc.get("payment_status"),
+                "paymentMethod": doc.get("payment_method"),
+                "customerId": str(user_id) if user_id else None,
+                "customerName": customer.get("displayName") or customer.get("email"),
+                "customerEmail": customer.get("email"),
+                "customerPhone": customer.get("phone"),
+                "items": sum(item.get("quantity", 0) for item in doc.get("items") or []),
+                "subtotal": doc.get("subtotal"),
+                "shippingFee": doc.get("shipping_fee"),
+                "discount": doc.get("discount"),
+                "vat": doc.get("vat"),
+                "total": doc.get("total_price"),
+                "completedDate": _isoformat(doc.get("completed_date")),
+            }
+
+
+def customer_export_rows(match, now):
+    """
+    Export rows of the customers matching raw ``match``, with their order
+    statistics (materialized on the user, see customer_stats.py), shaped
+    by one aggregation cursor in ``_id`` order. Name, email and phone are
+    customer-entered: write them through stream_export, whose CSV branch
+    escapes formula-like cells for CRM and spreadsheet imports.
+    """
+    cursor = User._get_collection().aggregate([
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "name": {"$ifNull": ["$displayName", {"$ifNull": ["$username", "$email"]}]},
+            "email": 1,
+            "phone": 1,
+            "created_at": 1,
+            "status": customer_status_expression(now),
+            "totalOrders": {"$ifNull": ["$order_stats.total_orders", 0]},
+            "totalSpent": {"$ifNull": ["$order_stats.total_spent", 0]},
+            "firstOrder": "$order_stats.first_order_at",
+            "lastOrder": "$order_stats.last_order_at",
+        }},
+    ], allowDiskUse=True, batchSize=BATCH_SIZE)
+    for doc in cursor:
+        total_orders = doc["totalOrders"]
+        yield {
+            "id": str(doc["_id"]),
+            "name": doc.get("name"),
+            "email": doc.get("email"),
+            "phone": doc.get("phone"),
+            "joinDate": _isoformat(doc.get("created_at")),
+            "status": doc["status"],
+            "isVip": total_orders > VIP_MIN_ORDERS,
+            "totalOrders": total_orders,
+            "totalSpent": doc["totalSpent"],
+            "averageOrderValue": doc["totalSpent"] / total_orders if total_orders > 0 else 0,
+            "firstOrder": _isoformat(doc.get("firstOrder")),
+            "lastOrder": _isoformat(doc.get("lastOrder")),
+        }
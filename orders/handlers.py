@@ -0,0 +1,22 @@
+"""
+Outbox event handlers for the orders app (delivered by `manage.py run_worker`)
+"""
+from common.outbox import subscribe
+from .customer_stats import apply_order_created, apply_order_status_changed
+from .sales_rollups import mark_day_dirty, order_day
+
+
+@subscribe("order.created")
+def update_customer_stats_on_create(event):
+    apply_order_created(event)
+
+
+@subscribe("order.status_changed")
+def update_customer_stats_on_status_change(event):
+    apply_order_status_changed(event)
+
+
+@subscribe("order.created")
+@subscribe("order.status_changed")
+def refresh_daily_sales(event):
+    mark_day_dirty(order_day(event["payload"]))
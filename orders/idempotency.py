@@ -0,0 +1,147 @@
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+The first request with a given key inserts a ``processing`` record (unique
+on user + key), runs the view and stores the response. Retries with the
+same key replay the stored response instead of running the view again, so
+a client retrying on timeout cannot create a second order.
+
+A view calls ``mark_side_effects(request)`` before its first write. If it
+then fails (exception or 5xx), the write may have been committed, so the
+record is kept as ``failed`` and retries replay the error instead of
+running the view again; failures before that point release the key.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+
+from bson import ObjectId
+from mongoengine.errors import NotUniqueError
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# A record still "processing" after this long belongs to a crashed request
+STALE_PROCESSING_AFTER = timedelta(minutes=5)
+_SIDE_EFFECTS_ATTR = "_idempotency_side_effects"
+
+
+def mark_side_effects(request):
+    """Signal that the view is about to write: a later failure keeps the key."""
+    setattr(request, _SIDE_EFFECTS_ATTR, True)
+
+
+def _fingerprint(data):
+    try:
+        payload = json.dumps(data, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        payload = repr(data)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _claim(user_id, key, request_hash):
+    """Insert the processing record; return (record, existing)."""
+    for _ in range(2):
+        try:
+            record = IdempotencyRecord(user=user_id, key=key, request_hash=request_hash)
+            record.save(force_insert=True)
+            return record, None
+        except NotUniqueError:
+            existing = IdempotencyRecord.objects(user=user_id, key=key).first()
+            if existing is None:
+                continue  # Expired between insert and lookup
+            cutoff = datetime.utcnow() - STALE_PROCESSING_AFTER
+            if existing.status == "processing" and existing.created_at < cutoff:
+                IdempotencyRecord.objects(id=existing.id, status="processing").delete()
+                continue
+            return None, existing
+    return None, None
+
+
+def _store(record, outcome, response_status, response_body, key):
+    try:
+        IdempotencyRecord.objects(id=record.id).update_one(
+            set__status=outcome,
+            set__response_status=response_status,
+            set__response_body=response_body,
+        )
+    except Exception as exc:
+        logger.warning("Failed to store idempotent response for key %s: %s", key, exc)
+
+
+def idempotent(view_func):
+    """
+    Make a view replay its response for repeated Idempotency-Key headers.
+
+    Must be applied below ``require_auth`` so ``request.user_claims`` is set.
+    Requests without the header are handled as before.
+    """
+    @wraps(view_func)
+    def _wrapped(self, request, *args, **kwargs):
+        key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+        if not key:
+            return view_func(self, request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} tối đa {MAX_KEY_LENGTH} ký tự"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user_id = ObjectId(request.user_claims["sub"])
+        request_hash = _fingerprint(request.data)
+        record, existing = _claim(user_id, key, request_hash)
+
+        if record is None:
+            if existing is None:
+                return Response(
+                    {"detail": "Yêu cầu đang được xử lý, vui lòng thử lại sau"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if existing.request_hash != request_hash:
+                return Response(
+                    {"detail": f"{IDEMPOTENCY_HEADER} đã được dùng cho một yêu cầu khác"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if existing.status == "processing":
+                return Response(
+                    {"detail": "Yêu cầu đang được xử lý, vui lòng thử lại sau"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            response = Response(existing.response_body, status=existing.response_status)
+            response["Idempotent-Replayed"] = "true"
+            return response
+
+        try:
+            response = view_func(self, request, *args, **kwargs)
+        except Exception:
+            if getattr(request, _SIDE_EFFECTS_ATTR, False):
+                _store(record, "failed", status.HTTP_500_INTERNAL_SERVER_ERROR, {
+                    "detail": "Yêu cầu trước đó đã gặp lỗi trong khi xử lý, vui lòng kiểm tra lại trước khi gửi yêu cầu mới"
+                }, key)
+            else:
+                record.delete()
+            raise
+
+        if response.status_code < 500:
+            _store(record, "completed", response.status_code, response.data, key)
+        elif getattr(request, _SIDE_EFFECTS_ATTR, False):
+            # The write may have been committed: retrying must not run it again
+            _store(record, "failed", response.status_code, response.data, key)
+        else:
+            try:
+                # Nothing was written: let the client retry with the same key
+                record.delete()
+            except Exception as exc:
+                logger.warning("Failed to release idempotency key %s: %s", key, exc)
+
+        return response
+
+    return _wrapped
@@ -0,0 +1,148 @@
+"""
+Index registry for the orders app (applied by ``manage.py sync_indexes``).
+
+Compound indexes follow the equality -> sort -> range rule for the query
+shapes the views actually run.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+INDEXES = {
+    "orders": [
+        # Order history: user (+ status) sorted by newest first; _id is the
+        # cursor tie-breaker so keyset pages are pure index range scans
+        {"keys": [("user", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]},
+        {"keys": [("user", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]},
+        # Admin order list (cursor mode without filters)
+        {"keys": [("created_at", DESCENDING), ("_id", DESCENDING)]},
+        # Dashboard / analytics: status + created_at range
+        {"keys": [("status", ASCENDING), ("created_at", DESCENDING)]},
+        # Admin order list filtered by payment status
+        {"keys": [("payment_status", ASCENDING), ("created_at", DESCENDING)]},
+        # Admin order search by number (order_seq is backfilled by backfill_order_seq)
+        {"keys": [("order_seq", ASCENDING)], "sparse": True},
+        # Admin order list sorted by total
+        {"keys": [("total_price", DESCENDING), ("_id", DESCENDING)]},
+    ],
+    "vouchers": [
+        # Expiry sweep: vouchers expired since the last run, and vouchers
+        # created or edited since then that are already past expiry
+        {"keys": [("expired_date", ASCENDING)]},
+        {"keys": [("updated_at", ASCENDING), ("expired_date", ASCENDING)]},
+        # Admin voucher list: newest first, status as start/expiry date ranges
+        {"keys": [
+            ("created_at", DESCENDING), ("_id", DESCENDING), ("start_date", ASCENDING), ("expired_date", ASCENDING),
+        ]},
+        # Admin voucher list of one campaign
+        {"keys": [("campaign", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]},
+    ],
+    "user_vouchers": [
+        # One wallet row per (user, voucher): bulk segment assignment upserts on it
+        {"keys": [("user", ASCENDING), ("voucher", ASCENDING)], "unique": True},
+        # Expiry sweep: active wallet rows of a batch of vouchers
+        {"keys": [("voucher", ASCENDING), ("status", ASCENDING)]},
+    ],
+}
+
+_NOW = datetime.utcnow()
+
+QUERIES = [
+    {
+        "name": "user order history",
+        "collection": "orders",
+        "filter": {"user": ObjectId()},
+        "sort": [("created_at", DESCENDING)],
+        "limit": 10,
+    },
+    {
+        "name": "user order history by status",
+        "collection": "orders",
+        "filter": {"user": ObjectId(), "status": "pending"},
+        "sort": [("created_at", DESCENDING)],
+        "limit": 10,
+    },
+    {
+        "name": "user order history page N (cursor)",
+        "collection": "orders",
+        "filter": {
+            "user": ObjectId(),
+            "$or": [
+                {"created_at": {"$lt": _NOW}},
+                {"created_at": _NOW, "_id": {"$lt": ObjectId()}},
+            ],
+        },
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 11,
+    },
+    {
+        "name": "admin orders page N (cursor)",
+        "collection": "orders",
+        "filter": {
+            "$or": [
+                {"created_at": {"$lt": _NOW}},
+                {"created_at": _NOW, "_id": {"$lt": ObjectId()}},
+            ],
+        },
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 21,
+    },
+    {
+        "name": "dashboard completed orders in period",
+        "collection": "orders",
+        "filter": {"status": "completed", "created_at": {"$gte": _NOW - timedelta(days=30)}},
+    },
+    {
+        "name": "admin orders by payment status",
+        "collection": "orders",
+        "filter": {"payment_status": "paid", "created_at": {"$gte": _NOW - timedelta(days=30)}},
+        "sort": [("created_at", DESCENDING)],
+    },
+    {
+        "name": "voucher expiry sweep",
+        "collection": "vouchers",
+        "filter": {"$or": [
+            {"expired_date": {"$gt": _NOW - timedelta(minutes=15), "$lte": _NOW}},
+            {"updated_at": {"$gt": _NOW - timedelta(minutes=15)}, "expired_date": {"$lte": _NOW}},
+        ]},
+    },
+    {
+        "name": "voucher expiry sweep rows",
+        "collection": "user_vouchers",
+        "filter": {"voucher": {"$in": [ObjectId(), ObjectId()]}, "status": "active"},
+    },
+    {
+        "name": "admin active vouchers",
+        "collection": "vouchers",
+        "filter": {
+            "$and": [
+                {"$or": [{"start_date": None}, {"start_date": {"$lte": _NOW}}]},
+                {"$or": [{"expired_date": None}, {"expired_date": {"$gte": _NOW}}]},
+            ]
+        },
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 20,
+    },
+    {
+        "name": "admin campaign vouchers",
+        "collection": "vouchers",
+        "filter": {"campaign": "campaign"},
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 20,
+    },
+    {
+        "name": "admin order search by number",
+        "collection": "orders",
+        "filter": {"$or": [{"order_seq": 123}, {"order_number": {"$regex": "^ORD-000123"}}]},
+        "sort": [("created_at", DESCENDING), ("_id", DESCENDING)],
+        "limit": 20,
+    },
+    {
+        "name": "admin orders sorted by total",
+        "collection": "orders",
+        "filter": {},
+        "sort": [("total_price", DESCENDING), ("_id", DESCENDING)],
+        "limit": 20,
+    },
+]
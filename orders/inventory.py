@@ -0,0 +1,156 @@
+"""
+Stock reservation helpers for checkout.
+
+Reservations are issued as one ordered ``bulk_write`` of conditional
+``$inc`` updates so that all order lines cost a single round trip and two
+concurrent checkouts can never both take the last units of a product.
+"""
+import logging
+from collections import OrderedDict
+
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from products.models import Product
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+LOW_STOCK_THRESHOLD = 10  # Keep in sync with Product.save()
+
+
+class InsufficientStockError(Exception):
+    """Raised when a product no longer has enough stock for a reservation."""
+
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for product {product_id} (requested {requested})")
+
+
+def _group_quantities(order_items):
+    """Sum quantities per product (a cart may hold one product in several sizes)."""
+    quantities = OrderedDict()
+    for item in order_items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def _stock_status_updates(product_ids):
+    """Mirror the status rules of Product.save() for raw $inc writes."""
+    return [
+        UpdateMany(
+            {"_id": {"$in": product_ids}, "stock": {"$lte": 0}},
+            {"$set": {"status": "out_of_stock"}},
+        ),
+        UpdateMany(
+            {
+                "_id": {"$in": product_ids},
+                "stock": {"$gt": 0, "$lt": LOW_STOCK_THRESHOLD},
+                "status": {"$in": ["active", "out_of_stock"]},
+            },
+            {"$set": {"status": "low_stock"}},
+        ),
+    ]
+
+
+def _release_operations(quantities):
+    ops = [
+        UpdateOne({"_id": product_id}, {"$inc": {"stock": qty, "sold": -qty}})
+        for product_id, qty in quantities.items()
+    ]
+    product_ids = list(quantities.keys())
+    # Products that were sold out by a reservation become purchasable again
+    ops.append(
+        UpdateMany(
+            {"_id": {"$in": product_ids}, "status": "out_of_stock", "stock": {"$gte": LOW_STOCK_THRESHOLD}},
+            {"$set": {"status": "active"}},
+        )
+    )
+    ops.append(
+        UpdateMany(
+            {"_id": {"$in": product_ids}, "status": "out_of_stock", "stock": {"$gt": 0}},
+            {"$set": {"status": "low_stock"}},
+        )
+    )
+    return ops
+
+
+def reserve_stock(order_items, session=None):
+    """
+    Atomically take stock for every order line.
+
+    Each line becomes ``update_one({_id, stock: {$gte: qty}}, {$inc: ...})``
+    with ``upsert=True``: when the stock guard does not match, the upsert
+    tries to insert a second document with the same ``_id`` and fails with a
+    duplicate key error. Because the bulk is ordered, MongoDB stops at that
+    line and reports its index, so we know exactly which earlier lines were
+    applied and can compensate them.
+
+    Raises InsufficientStockError if any line cannot be reserved; in that
+    case no stock is left decremented. Inside a transaction (``session``)
+    the failed write aborts the transaction, so no compensation is issued.
+    """
+    quantities = _group_quantities(order_items)
+    if not quantities:
+        return
+
+    product_ids = list(quantities.keys())
+    ops = [
+        UpdateOne(
+            {"_id": product_id, "stock": {"$gte": qty}},
+            {"$inc": {"stock": -qty, "sold": qty}},
+            upsert=True,
+        )
+        for product_id, qty in quantities.items()
+    ]
+    ops.extend(_stock_status_updates(product_ids))
+
+    collection = Product._get_collection()
+    try:
+        result = collection.bulk_write(ops, ordered=True, session=session)
+    except BulkWriteError as exc:
+        write_errors = exc.details.get("writeErrors", [])
+        failed = write_errors[0] if write_errors else {}
+        failed_index = failed.get("index", 0)
+        applied = OrderedDict(list(quantities.items())[:failed_index])
+        if applied and session is None:
+            release_stock_quantities(applied)
+        if failed.get("code") == DUPLICATE_KEY_ERROR and failed_index < len(product_ids):
+            failed_id = product_ids[failed_index]
+            raise InsufficientStockError(failed_id, quantities[failed_id])
+        raise
+
+    # An upsert only succeeds when the product vanished between validation
+    # and reservation; drop the stub document and undo the other lines.
+    upserted = result.upserted_ids or {}
+    if upserted and session is not None:
+        missing_index = min(upserted.keys())
+        raise InsufficientStockError(product_ids[missing_index], quantities[product_ids[missing_index]])
+    if upserted:
+        collection.delete_many({"_id": {"$in": list(upserted.values())}})
+        applied = OrderedDict(
+            (product_id, qty)
+            for index, (product_id, qty) in enumerate(quantities.items())
+            if index not in upserted
+        )
+        if applied:
+            release_stock_quantities(applied)
+        missing_index = min(upserted.keys())
+        raise InsufficientStockError(product_ids[missing_index], quantities[product_ids[missing_index]])
+
+
+def release_stock_quantities(quantities):
+    """Return previously reserved quantities ({product_id: qty}) in one bulk write."""
+    if not quantities:
+        return
+    try:
+        Product._get_collection().bulk_write(_release_operations(quantities), ordered=True)
+    except Exception as exc:
+        logger.error("Failed to release reserved stock %s: %s", dict(quantities), exc, exc_info=True)
+        raise
+
+
+def release_stock(order_items):
+    """Give back the stock taken for the given order items."""
+    release_stock_quantities(_group_quantities(order_items))
@@ -0,0 +1,62 @@
+"""
+Fill Order.order_seq (the numeric part of order_number) on existing orders.
+
+New orders get it on save; older ones need this once for the admin order
+search by number. Safe to re-run: only orders without order_seq are touched.
+
+Usage:
+    python manage.py backfill_order_seq
+    python manage.py backfill_order_seq --batch-size 10000
+"""
+from django.core.management.base import BaseCommand
+
+from orders.counters import ORDER_NUMBER_PREFIX
+from orders.models import Order
+
+# Orders whose number is not ORD-<digits> get null, so they are not picked up again
+ORDER_SEQ_EXPRESSION = {
+    "$convert": {
+        "input": {"$substrCP": ["$order_number", len(ORDER_NUMBER_PREFIX), 32]},
+        "to": "long",
+        "onError": None,
+        "onNull": None,
+    }
+}
+
+
+class Command(BaseCommand):
+    help = "Backfill order_seq on orders created before it existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Orders per update")
+
+    def handle(self, *args, **options):
+        collection = Order._get_collection()
+        batch_size = options["batch_size"]
+        updated = batches = 0
+        while True:
+            ids = [
+                doc["_id"]
+                for doc in collection.find({"order_seq": {"$exists": False}}, {"_id": 1}).limit(batch_size)
+            ]
+            if not ids:
+                break
+            result = collection.update_many(
+                {"_id": {"$in": ids}},
+                [{
+                    "$set": {
+                        "order_seq": {
+                            "$cond": [
+                                {"$eq": [{"$substrCP": ["$order_number", 0, len(ORDER_NUMBER_PREFIX)]}, ORDER_NUMBER_PREFIX]},
+                                ORDER_SEQ_EXPRESSION,
+                                None,
+                            ]
+                        }
+                    }
+                }],
+            )
+            updated += result.modified_count
+            batches += 1
+            self.stdout.write(f"  batch {batches}: {result.modified_count} order(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ order_seq set on {updated} order(s)"))
@@ -0,0 +1,162 @@
+"""
+Load test for the checkout write phase in sequential and transaction mode.
+
+Creates a throw-away product, users, addresses and carts, places orders
+from several threads through orders.checkout.place_order and prints the
+throughput and latency of each mode. Everything it creates is deleted
+afterwards; order numbers use a BENCH- prefix so the real order counter
+is not consumed.
+
+Usage:
+    python manage.py benchmark_checkout --orders 500 --threads 8
+    python manage.py benchmark_checkout --mode transaction
+"""
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_connection
+
+from common.models import OutboxEvent
+from orders.checkout import CHECKOUT_MODE_SEQUENTIAL, CHECKOUT_MODE_TRANSACTION, place_order
+from orders.models import Cart, Order, OrderItem, ProductInCart
+from products.models import Brand, ChildCategory, ParentCategory, Product
+from users.models import Address, User
+
+
+class Command(BaseCommand):
+    help = "Compare checkout throughput of sequential and transaction modes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=200, help="Orders per mode")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent checkouts")
+        parser.add_argument(
+            "--mode",
+            choices=["both", CHECKOUT_MODE_SEQUENTIAL, CHECKOUT_MODE_TRANSACTION],
+            default="both",
+        )
+
+    def handle(self, *args, **options):
+        total_orders = options["orders"]
+        threads = max(options["threads"], 1)
+        if total_orders < 1:
+            raise CommandError("--orders must be positive")
+
+        modes = [CHECKOUT_MODE_SEQUENTIAL, CHECKOUT_MODE_TRANSACTION] if options["mode"] == "both" else [options["mode"]]
+        if CHECKOUT_MODE_TRANSACTION in modes and not self._supports_transactions():
+            self.stdout.write(self.style.WARNING("MongoDB is not a replica set; skipping transaction mode"))
+            modes.remove(CHECKOUT_MODE_TRANSACTION)
+        if not modes:
+            return
+
+        run_id = uuid.uuid4().hex[:8]
+        fixtures = self._create_fixtures(run_id, threads, total_orders * len(modes))
+        try:
+            for mode in modes:
+                self._run(mode, run_id, fixtures, total_orders, threads)
+        finally:
+            self._cleanup(run_id, fixtures)
+
+    def _supports_transactions(self):
+        hello = get_connection().admin.command("hello")
+        return bool(hello.get("setName"))
+
+    def _create_fixtures(self, run_id, threads, stock):
+        brand = Brand(name=f"bench-{run_id}", slug=f"bench-{run_id}").save()
+        parent = ParentCategory(name=f"bench-{run_id}", slug=f"bench-{run_id}").save()
+        category = ChildCategory(name=f"bench-{run_id}", slug=f"bench-{run_id}", parent=parent).save()
+        product = Product(
+            name=f"bench-{run_id}",
+            slug=f"bench-{run_id}",
+            original_price=100000,
+            stock=stock,
+            brand=brand,
+            category=category,
+        ).save()
+
+        customers = []
+        for i in range(threads):
+            user = User(email=f"bench-{run_id}-{i}@example.invalid", role="user").save()
+            address = Address(
+                user=user, receiver="Bench", phone="0000000000", detail="-",
+                ward="-", district="-", province="-",
+            ).save()
+            cart = Cart(user=user).save()
+            customers.append((user, address, cart))
+
+        return {"brand": brand, "parent": parent, "category": category, "product": product, "customers": customers}
+
+    def _run(self, mode, run_id, fixtures, total_orders, threads):
+        product = fixtures["product"]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        counter = {"next": 0}
+
+        def worker(user, address, cart):
+            while True:
+                with lock:
+                    n = counter["next"]
+                    if n >= total_orders:
+                        return
+                    counter["next"] += 1
+
+                cart.products = [ProductInCart(product_id=product.id, quantity=1)]
+                cart.save()
+                order = Order(
+                    order_number=f"BENCH-{run_id}-{mode}-{n}",
+                    user=user,
+                    address=address,
+                    items=[OrderItem(
+                        product_id=product.id, product_name=f"bench-{run_id}",
+                        quantity=1, price=product.original_price, total=product.original_price,
+                    )],
+                    subtotal=product.original_price,
+                    total_price=product.original_price,
+                )
+                started = time.perf_counter()
+                try:
+                    place_order(order, cart, mode=mode)
+                except Exception as exc:
+                    with lock:
+                        errors.append(exc)
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        pool = [threading.Thread(target=worker, args=customer) for customer in fixtures["customers"]]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        self.stdout.write(f"\n{mode} ({threads} threads)")
+        self.stdout.write(f"  orders placed : {len(latencies)} / {total_orders}")
+        self.stdout.write(f"  errors        : {len(errors)}")
+        if errors:
+            self.stdout.write(f"  first error   : {errors[0]!r}")
+        if latencies:
+            ordered = sorted(latencies)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            self.stdout.write(f"  throughput    : {len(latencies) / wall:.1f} orders/s")
+            self.stdout.write(f"  latency p50   : {statistics.median(ordered) * 1000:.1f} ms")
+            self.stdout.write(f"  latency p99   : {p99 * 1000:.1f} ms")
+
+    def _cleanup(self, run_id, fixtures):
+        Order.objects(order_number__startswith=f"BENCH-{run_id}-").delete()
+        # Checkout records order.created events; drop them before a worker delivers them
+        OutboxEvent.objects(__raw__={"payload.orderNumber": {"$regex": f"^BENCH-{run_id}-"}}).delete()
+        for user, address, cart in fixtures["customers"]:
+            cart.delete()
+            address.delete()
+            user.delete()
+        fixtures["product"].delete()
+        fixtures["category"].delete()
+        fixtures["parent"].delete()
+        fixtures["brand"].delete()
+        self.stdout.write(self.style.SUCCESS("\n✓ Benchmark data cleaned up"))
@@ -0,0 +1,30 @@
+"""
+Mark wallet vouchers of expired vouchers as expired.
+
+Usage:
+    python manage.py expire_vouchers               # since the previous run
+    python manage.py expire_vouchers --full        # every expired voucher
+    python manage.py expire_vouchers --batch-size 1000
+
+The worker also runs this periodically (VOUCHER_EXPIRY_SWEEP_SECONDS);
+the command is for cron or a one-off catch-up.
+"""
+from django.core.management.base import BaseCommand
+
+from orders.voucher_expiry import BATCH_SIZE, sweep_expired_vouchers
+
+
+class Command(BaseCommand):
+    help = "Expire user_vouchers rows of vouchers past their expired_date"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Ignore the last sweep time")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Vouchers per update_many")
+
+    def handle(self, *args, **options):
+        metrics = sweep_expired_vouchers(batch_size=options["batch_size"], full=options["full"])
+        self.stdout.write(f"Since: {metrics['since'] or 'beginning'}")
+        self.stdout.write(f"Expired vouchers checked: {metrics['vouchers']} in {metrics['batches']} batch(es)")
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {metrics['rows']} wallet row(s) marked expired in {metrics['durationMs']} ms"
+        ))
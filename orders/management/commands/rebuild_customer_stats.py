@@ -0,0 +1,28 @@
+"""
+Recompute User.order_stats (order count, completed spend, first/last order)
+from the orders collection.
+
+Order events keep the stats current afterwards; run this once when
+deploying and whenever they need repairing. Safe to re-run.
+
+Usage:
+    python manage.py rebuild_customer_stats
+    python manage.py rebuild_customer_stats --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+
+from orders.customer_stats import REBUILD_BATCH_SIZE, rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized per-customer order statistics"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE, help="Customers per batch")
+
+    def handle(self, *args, **options):
+        result = rebuild_customer_stats(
+            batch_size=options["batch_size"],
+            on_progress=lambda progress: self.stdout.write(f"  {progress['processed']} customer(s)"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ Stats rebuilt for {result['processed']} customer(s)"))
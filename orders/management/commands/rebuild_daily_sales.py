@@ -0,0 +1,33 @@
+"""
+Recompute the daily_sales rollups read by the admin dashboard and analytics.
+
+Order events keep recent days current; run this once when deploying (it
+backfills from the first order or customer) and after bulk data fixes.
+Safe to re-run: every day is recomputed from its orders.
+
+Usage:
+    python manage.py rebuild_daily_sales
+    python manage.py rebuild_daily_sales --days 30
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from orders.sales_rollups import day_start, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Only the last N days (default: all history)")
+
+    def handle(self, *args, **options):
+        start = None
+        if options["days"]:
+            start = day_start(datetime.utcnow()) - timedelta(days=options["days"] - 1)
+        result = rebuild(
+            start=start,
+            on_progress=lambda progress: self.stdout.write(f"  {progress['day']}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ {result['days']} day(s) rolled up"))
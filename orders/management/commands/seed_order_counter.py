@@ -0,0 +1,24 @@
+"""
+Seed the order number counter from existing orders.
+
+The counter seeds itself on first use; this is for raising it explicitly,
+e.g. after importing orders (safe to re-run: the counter is only ever
+moved forward).
+
+Usage:
+    python manage.py seed_order_counter
+"""
+from django.core.management.base import BaseCommand
+
+from orders.counters import ORDER_NUMBER_COUNTER, highest_order_sequence, seed_counter
+
+
+class Command(BaseCommand):
+    help = "Seed the counters collection from the highest existing order number"
+
+    def handle(self, *args, **options):
+        max_seq = highest_order_sequence()
+
+        value = seed_counter(ORDER_NUMBER_COUNTER, max_seq)
+        self.stdout.write(f"Highest existing order number: {max_seq}")
+        self.stdout.write(self.style.SUCCESS(f"✓ Counter '{ORDER_NUMBER_COUNTER}' is at {value}"))
@@ -3,6 +3,7 @@ Orders module models: Cart, Wishlist, Order, OrderItem
 """
 import mongoengine as me
 from datetime import datetime
+from django.conf import settings
 
 
 class ProductInCart(me.EmbeddedDocument):
@@ -60,14 +61,41 @@ class OrderItem(me.EmbeddedDocument):
     meta = {"strict": False}  # Ignore unknown fields like _id in embedded documents
 
 
+class ShippingAddress(me.EmbeddedDocument):
+    """Snapshot of the delivery address at order time"""
+    address_id = me.ObjectIdField()  # Source Address (may be deleted later)
+    receiver = me.StringField()
+    phone = me.StringField()
+    detail = me.StringField()
+    ward = me.StringField()
+    district = me.StringField()
+    province = me.StringField()
+    
+    meta = {"strict": False}
+    
+    @classmethod
+    def from_address(cls, address):
+        return cls(
+            address_id=address.id,
+            receiver=address.receiver,
+            phone=address.phone,
+            detail=address.detail,
+            ward=address.ward,
+            district=address.district,
+            province=address.province,
+        )
+
+
 class Order(me.Document):
     """Order model - Customer orders"""
     # Order identification
     order_number = me.StringField(required=True, unique=True)  # "ORD-001", "ORD-002", etc.
+    order_seq = me.IntField()  # Numeric part of order_number, for indexed admin search
     
     # Customer & delivery
     user = me.ReferenceField('User', required=True)
     address = me.ReferenceField('Address', required=True)  # Shipping address
+    shipping_address = me.EmbeddedDocumentField(ShippingAddress)  # Snapshot, survives address deletion
     
     # Order items
     items = me.EmbeddedDocumentListField(OrderItem, required=True)
@@ -119,28 +147,24 @@ class Order(me.Document):
         ]
     }
     
-    def save(self, *args, **kwargs):
+    def prepare_for_save(self):
         """Auto-generate order_number and handle status changes"""
+        from .counters import next_order_number, parse_order_number
+        
         # Generate order_number if not set
         if not self.order_number:
-            # Find the latest order number
-            last_order = Order.objects.order_by('-order_number').first()
-            if last_order and last_order.order_number.startswith('ORD-'):
-                try:
-                    last_num = int(last_order.order_number.split('-')[1])
-                    new_num = last_num + 1
-                except (ValueError, IndexError):
-                    new_num = 1
-            else:
-                new_num = 1
-            
-            self.order_number = f"ORD-{new_num:06d}"  # ORD-000001, ORD-000002, etc.
+            self.order_number = next_order_number()  # ORD-000001, ORD-000002, etc.
+        if self.order_seq is None:
+            self.order_seq = parse_order_number(self.order_number)
         
         # Set completed_date when status becomes 'completed'
         if self.status == 'completed' and not self.completed_date:
             self.completed_date = datetime.utcnow()
         
         self.updated_at = datetime.utcnow()
+    
+    def save(self, *args, **kwargs):
+        self.prepare_for_save()
         return super(Order, self).save(*args, **kwargs)
     
     def __str__(self):
@@ -190,6 +214,11 @@ class Voucher(me.Document):
     expired_date = me.DateTimeField()
     categories = me.ListField(me.ObjectIdField())  # Applicable categories
     
+    # Bulk-generated campaign codes: each one can be added by a single user
+    campaign = me.StringField()
+    single_use = me.BooleanField(default=False)
+    claimed_by = me.ObjectIdField()  # User who added a single-use code
+    
     # Timestamps
     created_at = me.DateTimeField(default=datetime.utcnow)
     updated_at = me.DateTimeField(default=datetime.utcnow)
@@ -208,6 +237,47 @@ class Voucher(me.Document):
         return f"{self.code} - {self.name}"
 
 
+class Counter(me.Document):
+    """Named monotonic sequence (e.g. order numbers), incremented atomically"""
+    name = me.StringField(primary_key=True)
+    seq = me.IntField(default=0, min_value=0)
+    
+    meta = {"collection": "counters"}
+
+
+class DailySales(me.Document):
+    """Sales rollup of one UTC day (orders created that day), see orders/sales_rollups.py"""
+    day = me.DateTimeField(primary_key=True)  # Midnight UTC
+    orders = me.IntField(default=0)
+    revenue = me.FloatField(default=0)  # Completed orders only
+    completed_orders = me.IntField(default=0)
+    status_counts = me.DictField()  # status -> order count
+    products = me.ListField(me.DictField())  # [{product_id, name, units, revenue}] of completed orders
+    new_customers = me.IntField(default=0)
+    updated_at = me.DateTimeField(default=datetime.utcnow)
+
+    meta = {"collection": "daily_sales"}
+
+
+class IdempotencyRecord(me.Document):
+    """Stored outcome of a request sent with an Idempotency-Key header"""
+    user = me.ObjectIdField(required=True)
+    key = me.StringField(required=True, max_length=255)
+    request_hash = me.StringField()  # Fingerprint of the request body
+    status = me.StringField(choices=["processing", "completed", "failed"], default="processing")
+    response_status = me.IntField()
+    response_body = me.DictField()
+    created_at = me.DateTimeField(default=datetime.utcnow)
+    
+    meta = {
+        "collection": "idempotency_keys",
+        "indexes": [
+            {"fields": ["user", "key"], "unique": True},
+            {"fields": ["created_at"], "expireAfterSeconds": settings.IDEMPOTENCY_KEY_TTL_SECONDS},
+        ]
+    }
+
+
 class UserVoucher(me.Document):
     """User-Voucher relationship - Track which vouchers user has added"""
     user = me.ReferenceField('User', required=True)
@@ -221,10 +291,11 @@ class UserVoucher(me.Document):
     
     meta = {
         "collection": "user_vouchers",
+        # The unique (user, voucher) index lives in orders/indexes.py
+        # (manage.py sync_indexes) so existing duplicates can be cleaned first
         "indexes": [
             "user",
             "voucher",
-            ("user", "voucher"),  # Compound index for uniqueness check
             "status"
         ]
     }
@@ -0,0 +1,57 @@
+"""
+Keyset (cursor) pagination over (created_at, _id).
+
+A cursor encodes the sort key of the last row of a page, so the next page
+is an index range scan that costs the same on page 1 and page 10,000,
+unlike skip/limit which walks every skipped row.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+
+
+def encode_cursor(created_at, object_id):
+    raw = f"{created_at.isoformat()},{object_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value):
+    """Return (created_at, ObjectId); raise ValueError for malformed cursors."""
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        created_at, object_id = raw.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except (ValueError, TypeError, binascii.Error, InvalidId, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def cursor_filter(cursor, descending=True):
+    """Q selecting rows strictly after ``cursor`` in (created_at, _id) order."""
+    created_at, object_id = decode_cursor(cursor)
+    if descending:
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=object_id)
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=object_id)
+
+
+def cursor_order(descending=True):
+    return ("-created_at", "-id") if descending else ("created_at", "id")
+
+
+def paginate_by_cursor(queryset, cursor, limit, descending=True):
+    """
+    Fetch one page of ``queryset``.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        queryset = queryset.filter(cursor_filter(cursor, descending))
+    rows = list(queryset.order_by(*cursor_order(descending)).limit(limit + 1))
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_next and rows else None
+    return rows, next_cursor
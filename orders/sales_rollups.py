@@ -0,0 +1,204 @@
+"""
+Daily sales rollups (``daily_sales``) for the admin dashboard and analytics.
+
+One document per UTC day summarises the orders created that day: order
+count per status, completed revenue, units and revenue per product, and
+the customers who registered that day. Reading a period is then a scan of
+at most a few hundred small documents, whatever the size of ``orders``.
+
+A day is recomputed from its own orders rather than incremented, so
+replayed events and late status changes cannot skew it. Order events mark
+their day dirty by queueing one debounced ``orders.rollup_sales_day`` job
+per day; a periodic job also refreshes today and yesterday and fills in
+days that have no rollup yet (a few per run), and ``manage.py
+rebuild_daily_sales`` backfills history in one go. Readers check
+``covers`` first and fall back to the raw orders while days are missing.
+"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from common.jobs import enqueue
+from users.models import User
+from .models import DailySales, Order
+
+ROLLUP_DELAY_SECONDS = 30
+ONE_DAY = timedelta(days=1)
+
+
+def day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_day(day):
+    """Recompute and store the rollup of ``day``; returns the stored document."""
+    day = day_start(day)
+    end = day + ONE_DAY
+    facet = next(Order._get_collection().aggregate([
+        {"$match": {"created_at": {"$gte": day, "$lt": end}}},
+        {"$facet": {
+            "statuses": [
+                {"$group": {"_id": "$status", "orders": {"$sum": 1}, "revenue": {"$sum": "$total_price"}}},
+            ],
+            "products": [
+                {"$match": {"status": "completed"}},
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": "$items.product_id",
+                    "name": {"$first": "$items.product_name"},
+                    "units": {"$sum": "$items.quantity"},
+                    "revenue": {"$sum": "$items.total"},
+                }},
+            ],
+        }},
+    ], allowDiskUse=True), {"statuses": [], "products": []})
+
+    status_counts = {row["_id"]: row["orders"] for row in facet["statuses"] if row["_id"]}
+    completed = next((row for row in facet["statuses"] if row["_id"] == "completed"), None)
+    doc = {
+        "_id": day,
+        "orders": sum(row["orders"] for row in facet["statuses"]),
+        "revenue": completed["revenue"] if completed else 0,
+        "completed_orders": completed["orders"] if completed else 0,
+        "status_counts": status_counts,
+        "products": [
+            {"product_id": row["_id"], "name": row["name"], "units": row["units"], "revenue": row["revenue"]}
+            for row in facet["products"]
+        ],
+        "new_customers": User._get_collection().count_documents(
+            {"role": "user", "created_at": {"$gte": day, "$lt": end}}
+        ),
+        "updated_at": datetime.utcnow(),
+    }
+    DailySales._get_collection().replace_one({"_id": day}, doc, upsert=True)
+    return doc
+
+
+def mark_day_dirty(moment):
+    """Queue a recompute of the day of ``moment``; at most one per day is queued."""
+    day = day_start(moment)
+    enqueue(
+        "orders.rollup_sales_day",
+        {"day": day.isoformat()},
+        delay=0 if getattr(settings, "JOBS_EAGER", False) else ROLLUP_DELAY_SECONDS,
+        dedupe_key=f"rollup_sales:{day:%Y-%m-%d}",
+    )
+
+
+def order_day(payload):
+    """Creation time of the order an event is about"""
+    if payload.get("createdAt"):
+        return datetime.fromisoformat(payload["createdAt"])
+    # Events recorded before createdAt was added: the ObjectId carries the insert time
+    return ObjectId(payload["orderId"]).generation_time.replace(tzinfo=None)
+
+
+def first_activity():
+    """Creation time of the first order or customer, None when there are none"""
+    first_order = Order._get_collection().find_one({}, {"created_at": 1}, sort=[("created_at", 1)])
+    first_user = User._get_collection().find_one(
+        {"role": "user", "created_at": {"$ne": None}}, {"created_at": 1}, sort=[("role", 1), ("created_at", 1)]
+    )
+    candidates = [doc["created_at"] for doc in (first_order, first_user) if doc and doc.get("created_at")]
+    return min(candidates) if candidates else None
+
+
+def covers(start, end):
+    """True when every day of [start, end) with possible activity has its rollup"""
+    first = first_activity()
+    if first is None:
+        return True
+    start = day_start(max(start, first))
+    if start >= end:
+        return True
+    expected = (end - start).days
+    return DailySales._get_collection().count_documents({"_id": {"$gte": start, "$lt": end}}) >= expected
+
+
+def missing_days(limit):
+    """Up to ``limit`` days since the first activity that have no rollup yet, most recent first"""
+    first = first_activity()
+    if first is None:
+        return []
+    first = day_start(first)
+    today = day_start(datetime.utcnow())
+    existing = {doc["_id"] for doc in DailySales._get_collection().find({"_id": {"$gte": first}}, {"_id": 1})}
+    missing = []
+    day = today
+    while day >= first and len(missing) < limit:
+        if day not in existing:
+            missing.append(day)
+        day -= ONE_DAY
+    return missing
+
+
+def rebuild(start=None, end=None, on_progress=None):
+    """Recompute every day from ``start`` (default: first order or customer) to ``end`` (today)."""
+    if start is None:
+        start = first_activity()
+        if start is None:
+            return {"days": 0}
+    day = day_start(start)
+    last = day_start(end or datetime.utcnow())
+    days = 0
+    while day <= last:
+        rollup_day(day)
+        days += 1
+        if on_progress:
+            on_progress({"days": days, "day": day.strftime("%Y-%m-%d")})
+        day += ONE_DAY
+    return {"days": days}
+
+
+def period_totals(prev_start, start, end):
+    """Orders, completed revenue and new customers for [prev_start, start) and [start, end)"""
+    grouped = DailySales._get_collection().aggregate([
+        {"$match": {"_id": {"$gte": prev_start, "$lt": end}}},
+        {"$group": {
+            "_id": {"$gte": ["$_id", start]},
+            "orders": {"$sum": "$orders"},
+            "revenue": {"$sum": "$revenue"},
+            "new_customers": {"$sum": "$new_customers"},
+        }},
+    ])
+    empty = {"orders": 0, "revenue": 0, "new_customers": 0}
+    totals = {"current": dict(empty), "previous": dict(empty)}
+    for row in grouped:
+        totals["current" if row.pop("_id") else "previous"] = row
+    return totals
+
+
+def completed_by_bucket(start, unit):
+    """{bucket start: (revenue, completed orders)} per day or month since ``start``"""
+    if unit == "day":
+        rows = DailySales._get_collection().find(
+            {"_id": {"$gte": start}}, {"revenue": 1, "completed_orders": 1}
+        )
+        return {row["_id"]: (row.get("revenue", 0), row.get("completed_orders", 0)) for row in rows}
+    grouped = DailySales._get_collection().aggregate([
+        {"$match": {"_id": {"$gte": start}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$_id", "unit": unit}},
+            "revenue": {"$sum": "$revenue"},
+            "orders": {"$sum": "$completed_orders"},
+        }},
+    ])
+    return {row["_id"]: (row["revenue"], row["orders"]) for row in grouped}
+
+
+def top_products(start, end, limit=10):
+    """Best-selling products by completed revenue over [start, end)"""
+    rows = DailySales._get_collection().aggregate([
+        {"$match": {"_id": {"$gte": start, "$lt": end}}},
+        {"$unwind": "$products"},
+        {"$group": {
+            "_id": "$products.product_id",
+            "productName": {"$last": "$products.name"},
+            "sales": {"$sum": "$products.units"},
+            "revenue": {"$sum": "$products.revenue"},
+        }},
+        {"$sort": {"revenue": -1}},
+        {"$limit": limit},
+    ])
+    return [{"productId": str(row.pop("_id")), **row} for row in rows]
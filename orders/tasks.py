@@ -0,0 +1,134 @@
+"""
+Background jobs for the orders app (run by `manage.py run_worker`)
+"""
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from common.jobs import heartbeat, job
+from products.models import Product
+from .models import OrderReview
+from .sales_rollups import day_start, missing_days, rollup_day
+from .voucher_campaigns import (
+    DEFAULT_CODE_LENGTH,
+    assign_voucher,
+    existing_customer_ids,
+    generate_campaign_codes,
+    segment_user_ids,
+)
+from .voucher_expiry import sweep_expired_vouchers
+
+logger = logging.getLogger(__name__)
+
+# Missing daily_sales days filled in by each orders.rollup_recent_sales run
+ROLLUP_BACKFILL_DAYS_PER_RUN = 31
+
+
+def sync_product_rating(product_id):
+    """Recalculate average rating for a product from its reviews."""
+    if not product_id:
+        return None
+
+    pipeline = [
+        {"$match": {"product_id": product_id, "rating": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": "$product_id",
+                "avg_rating": {"$avg": "$rating"},
+            }
+        },
+    ]
+    result = next(OrderReview._get_collection().aggregate(pipeline), None)
+    avg_rating = 0.0
+    if result and result.get("avg_rating") is not None:
+        try:
+            avg_rating = round(float(result["avg_rating"]), 2)
+        except (TypeError, ValueError):
+            avg_rating = 0.0
+
+    Product.objects(id=product_id).update_one(set__rate=avg_rating)
+    return avg_rating
+
+
+@job("orders.sync_product_rating")
+def sync_product_rating_job(payload, current_job):
+    product_id = payload.get("product_id")
+    rating = sync_product_rating(ObjectId(product_id) if product_id else None)
+    return {"productId": product_id, "rate": rating}
+
+
+@job(
+    "orders.expire_vouchers",
+    # A failed sweep is simply redone by the next scheduled run
+    max_attempts=1,
+    every=settings.VOUCHER_EXPIRY_SWEEP_SECONDS,
+)
+def expire_vouchers_job(payload, current_job):
+    metrics = sweep_expired_vouchers(
+        on_progress=lambda progress: heartbeat(current_job, **progress),
+    )
+    logger.info("Voucher expiry sweep: %s", metrics)
+    return metrics
+
+
+@job("orders.rollup_sales_day")
+def rollup_sales_day_job(payload, current_job):
+    rollup = rollup_day(datetime.fromisoformat(payload["day"]))
+    return {"day": payload["day"], "orders": rollup["orders"], "revenue": rollup["revenue"]}
+
+
+@job(
+    "orders.rollup_recent_sales",
+    # Redone by the next scheduled run anyway
+    max_attempts=1,
+    every=settings.ANALYTICS_ROLLUP_SECONDS,
+)
+def rollup_recent_sales_job(payload, current_job):
+    today = day_start(datetime.utcnow())
+    # Yesterday too, so registrations just before midnight are counted
+    days = [today - timedelta(days=1), today]
+    # Then a bounded slice of history that was never rolled up
+    backfill = [day for day in missing_days(ROLLUP_BACKFILL_DAYS_PER_RUN + len(days)) if day not in days]
+    days += backfill[:ROLLUP_BACKFILL_DAYS_PER_RUN]
+    for day in days:
+        rollup_day(day)
+    return {"days": [day.strftime("%Y-%m-%d") for day in days]}
+
+
+@job("orders.generate_voucher_codes")
+def generate_voucher_codes_job(payload, current_job):
+    template = dict(payload["template"])
+    for field in ("start_date", "expired_date"):
+        if template.get(field):
+            template[field] = datetime.fromisoformat(template[field])
+    template["categories"] = [ObjectId(category_id) for category_id in template.get("categories", [])]
+    return generate_campaign_codes(
+        payload["campaign"],
+        payload["count"],
+        template,
+        prefix=payload.get("prefix", ""),
+        length=payload.get("length", DEFAULT_CODE_LENGTH),
+        on_progress=lambda progress: heartbeat(current_job, **progress),
+    )
+
+
+@job("orders.assign_voucher")
+def assign_voucher_job(payload, current_job):
+    skipped = []
+    if payload.get("user_ids"):
+        # Unknown ids (or non-customers) would get orphan wallet rows
+        requested = list(dict.fromkeys(ObjectId(user_id) for user_id in payload["user_ids"]))
+        user_ids, skipped = existing_customer_ids(requested)
+    else:
+        user_ids = segment_user_ids(payload["segment"])
+    result = assign_voucher(
+        ObjectId(payload["voucher_id"]),
+        user_ids,
+        on_progress=lambda progress: heartbeat(current_job, **progress),
+    )
+    result["segment"] = payload.get("segment")
+    if skipped:
+        result["skipped"] = [str(user_id) for user_id in skipped]
+    return result
@@ -8,7 +8,7 @@ from datetime import datetime
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from mongoengine.errors import ValidationError as MEValidationError
+from mongoengine.errors import NotUniqueError, ValidationError as MEValidationError
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FormParser, MultiPartParser
@@ -21,11 +21,18 @@ from django.conf import settings
 from django.core.files.storage import default_storage
 from django.utils import timezone
 
+from common.jobs import defer
+from common.outbox import record_event
 from users.auth import require_auth
 from users.authentication import JWTAuthentication
 from users.models import User, Address
 from products.models import Product, ChildCategory
 from products.views import _pick_lang
+from .checkout import VoucherUnavailableError, cancel_order, place_order
+from .idempotency import idempotent, mark_side_effects
+from .inventory import InsufficientStockError
+from .pagination import paginate_by_cursor
+from .voucher_cache import get_voucher_by_code, get_voucher_by_id
 from .models import (
     Cart,
     ProductInCart,
@@ -34,6 +41,7 @@ from .models import (
     Order,
     OrderItem,
     OrderReview,
+    ShippingAddress,
 )
 
 logger = logging.getLogger(__name__)
@@ -60,32 +68,14 @@ def _get_or_create_cart(user):
     return cart
 
 
-def _sync_product_rating(product_id):
-    """Recalculate average rating for a product from its reviews."""
-    if not product_id:
-        return
-
-    try:
-        pipeline = [
-            {"$match": {"product_id": product_id, "rating": {"$ne": None}}},
-            {
-                "$group": {
-                    "_id": "$product_id",
-                    "avg_rating": {"$avg": "$rating"},
-                }
-            },
-        ]
-        result = next(OrderReview._get_collection().aggregate(pipeline), None)
-        avg_rating = 0.0
-        if result and result.get("avg_rating") is not None:
-            try:
-                avg_rating = round(float(result["avg_rating"]), 2)
-            except (TypeError, ValueError):
-                avg_rating = 0.0
-
-        Product.objects(id=product_id).update_one(set__rate=avg_rating)
-    except Exception as exc:
-        logger.warning("Failed to sync rating for product %s: %s", product_id, exc)
+def _defer_rating_sync(product_id):
+    """Queue a rating recalculation; repeated reviews collapse into one queued job."""
+    if product_id:
+        defer(
+            "orders.sync_product_rating",
+            {"product_id": str(product_id)},
+            dedupe_key=f"orders.sync_product_rating:{product_id}",
+        )
 
 
 def _validate_size_color(product, size, color):
@@ -672,14 +662,8 @@ class VoucherValidateView(APIView):
     def post(self, request):
         """Validate voucher code"""
         try:
-            user_id = request.user_claims['sub']
-            user = User.objects(id=ObjectId(user_id)).first()
-            
-            if not user:
-                return Response(
-                    {"valid": False, "message": "User not found"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+            # Only the id is needed: the user_vouchers lookup below scopes to the user
+            user_id = ObjectId(request.user_claims['sub'])
             
             # Get request data
             code = request.data.get('code')
@@ -696,8 +680,8 @@ class VoucherValidateView(APIView):
             # Normalize code
             code = code.upper().strip()
             
-            # Find voucher by code
-            voucher = Voucher.objects(code=code).first()
+            # Find voucher by code (cached, including unknown codes)
+            voucher = get_voucher_by_code(code)
             if not voucher:
                 return Response(
                     {"valid": False, "message": "Mã voucher không hợp lệ"},
@@ -705,7 +689,7 @@ class VoucherValidateView(APIView):
                 )
             
             # Find UserVoucher
-            user_voucher = UserVoucher.objects(user=user, voucher=voucher).first()
+            user_voucher = UserVoucher.objects(user=user_id, voucher=voucher.id).first()
             if not user_voucher:
                 return Response(
                     {"valid": False, "message": "Voucher chưa được thêm vào tài khoản"},
@@ -728,9 +712,7 @@ class VoucherValidateView(APIView):
             # Check voucher validity time
             now = datetime.utcnow()
             if voucher.expired_date and voucher.expired_date < now:
-                # Update UserVoucher status
-                user_voucher.status = "expired"
-                user_voucher.save()
+                # The wallet row is marked expired by the expiry sweep
                 return Response(
                     {"valid": False, "message": "Voucher đã hết hạn"},
                     status=status.HTTP_400_BAD_REQUEST
@@ -864,40 +846,57 @@ def _calculate_vat(subtotal, shipping_fee, discount):
     """
     return 0
 
-def _update_product_stock(order_items):
-    """
-    Cập nhật stock và sold cho các sản phẩm trong order
-    """
+def _insufficient_stock_message(exc, order_items):
+    """Build the out-of-stock message for a failed reservation"""
+    product_name = "Sản phẩm"
     for order_item in order_items:
-        product = Product.objects(id=order_item.product_id).first()
-        if product:
-            product.stock -= order_item.quantity
-            if product.stock < 0:
-                product.stock = 0
-            product.sold += order_item.quantity
-            product.save()
+        if order_item.product_id == exc.product_id:
+            product_name = order_item.product_name or product_name
+            break
+    product = Product.objects(id=exc.product_id).only("stock").first()
+    remaining = product.stock if product else 0
+    return f"Sản phẩm {product_name} chỉ còn {max(remaining, 0)} sản phẩm"
+
+def _raw_ref_id(document, field_name):
+    """ObjectId stored in a reference field, without dereferencing it"""
+    value = document._data.get(field_name)
+    return getattr(value, "id", value)
+
+
+def _serialize_shipping_address(order, address=None):
+    """Address block of an order: the checkout snapshot, else the live Address"""
+    snapshot = order.shipping_address
+    if snapshot:
+        return {
+            "_id": str(snapshot.address_id) if snapshot.address_id else None,
+            "receiver": snapshot.receiver,
+            "phone": snapshot.phone,
+            "detail": snapshot.detail,
+            "ward": snapshot.ward,
+            "district": snapshot.district,
+            "province": snapshot.province
+        }
+    if address:
+        return {
+            "_id": str(address.id),
+            "receiver": address.receiver,
+            "phone": address.phone,
+            "detail": address.detail,
+            "ward": address.ward,
+            "district": address.district,
+            "province": address.province
+        }
+    address_id = _raw_ref_id(order, "address")
+    return {"_id": str(address_id) if address_id else None}
 
-def _serialize_order(order):
-    """Serialize order to dict"""
-    # Reload references
-    if order.address:
-        order.address.reload()
-    if order.voucher:
-        order.voucher.reload()
-    
+
+def _build_order_data(order, address=None, voucher=None):
+    """Serialize order to dict using pre-fetched address and voucher"""
     data = {
         "_id": str(order.id),
         "order_number": order.order_number,
-        "user": str(order.user.id),
-        "address": {
-            "_id": str(order.address.id),
-            "receiver": order.address.receiver,
-            "phone": order.address.phone,
-            "detail": order.address.detail,
-            "ward": order.address.ward,
-            "district": order.address.district,
-            "province": order.address.province
-        },
+        "user": str(_raw_ref_id(order, "user")),
+        "address": _serialize_shipping_address(order, address),
         "items": [
             {
                 "product_id": str(item.product_id),
@@ -925,16 +924,50 @@ def _serialize_order(order):
         "created_at": order.created_at.isoformat() if order.created_at else None
     }
     
-    if order.voucher:
+    if voucher:
         data["voucher"] = {
-            "_id": str(order.voucher.id),
-            "code": order.voucher.code,
-            "name": order.voucher.name
+            "_id": str(voucher.id),
+            "code": voucher.code,
+            "name": voucher.name
         }
     
     return data
 
 
+def _serialize_orders(orders):
+    """
+    Serialize a page of orders.
+    Addresses (only for orders without a snapshot) and vouchers are fetched
+    with one query per collection instead of a reload per order.
+    """
+    orders = list(orders)
+    address_ids = {
+        _raw_ref_id(order, "address") for order in orders
+        if not order.shipping_address and _raw_ref_id(order, "address")
+    }
+    voucher_ids = {_raw_ref_id(order, "voucher") for order in orders if _raw_ref_id(order, "voucher")}
+    
+    addresses = {address.id: address for address in Address.objects(id__in=list(address_ids))} if address_ids else {}
+    vouchers = {
+        voucher.id: voucher
+        for voucher in Voucher.objects(id__in=list(voucher_ids)).only("id", "code", "name")
+    } if voucher_ids else {}
+    
+    return [
+        _build_order_data(
+            order,
+            addresses.get(_raw_ref_id(order, "address")),
+            vouchers.get(_raw_ref_id(order, "voucher"))
+        )
+        for order in orders
+    ]
+
+
+def _serialize_order(order):
+    """Serialize order to dict"""
+    return _serialize_orders([order])[0]
+
+
 def _ensure_reviewable_order(order):
     """Ensure order is eligible for reviews"""
     if order.status != "completed":
@@ -1213,11 +1246,18 @@ class OrderReviewCreateView(APIView):
                     images=item["images"],
                 )
                 review.save()
+                record_event("review.created", {
+                    "reviewId": str(review.id),
+                    "orderId": str(order.id),
+                    "userId": str(user.id),
+                    "productId": str(review.product_id),
+                    "rating": review.rating,
+                })
                 created_reviews.append(review)
                 touched_product_ids.add(review.product_id)
 
             for product_id in touched_product_ids:
-                _sync_product_rating(product_id)
+                _defer_rating_sync(product_id)
 
             response_data = {
                 "orderId": str(order.id),
@@ -1293,7 +1333,7 @@ class OrderReviewUpdateView(APIView):
 
             review.save()
             if rating_updated:
-                _sync_product_rating(review.product_id)
+                _defer_rating_sync(review.product_id)
             return Response({"review": _serialize_review(review)}, status=status.HTTP_200_OK)
 
         except InvalidId:
@@ -1303,9 +1343,11 @@ class OrderReviewUpdateView(APIView):
 
 
 class OrderCreateView(APIView):
-    """POST /api/orders - Create new order"""
+    """POST /api/orders - Create new order
+       Send an Idempotency-Key header to make client retries safe"""
     
     @require_auth
+    @idempotent
     def post(self, request):
         """Create new order from cart"""
         try:
@@ -1375,7 +1417,7 @@ class OrderCreateView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                voucher = Voucher.objects(id=voucher_obj_id).first()
+                voucher = get_voucher_by_id(voucher_obj_id)
                 if not voucher:
                     return Response(
                         {"detail": "Voucher không tồn tại"},
@@ -1398,8 +1440,7 @@ class OrderCreateView(APIView):
                 # Check voucher validity time
                 now = datetime.utcnow()
                 if voucher.expired_date and voucher.expired_date < now:
-                    user_voucher.status = "expired"
-                    user_voucher.save()
+                    # The wallet row is marked expired by the expiry sweep
                     return Response(
                         {"detail": "Voucher đã hết hạn"},
                         status=status.HTTP_400_BAD_REQUEST
@@ -1472,6 +1513,7 @@ class OrderCreateView(APIView):
             order = Order(
                 user=user,
                 address=address,
+                shipping_address=ShippingAddress.from_address(address),
                 items=order_items,
                 subtotal=subtotal,
                 shipping_fee=shipping_fee,
@@ -1485,21 +1527,20 @@ class OrderCreateView(APIView):
                 notes=notes
             )
             
-            # Save order (order_number will be auto-generated)
-            order.save()
-            
-            # Update product stock
-            _update_product_stock(order_items)
-            
-            # Update UserVoucher if voucher was used
-            if user_voucher:
-                user_voucher.status = "used"
-                user_voucher.used_at = datetime.utcnow()
-                user_voucher.save()
-            
-            # Clear cart
-            cart.products = []
-            cart.save()
+            # Reserve stock, save order, consume voucher and clear cart
+            mark_side_effects(request)
+            try:
+                place_order(order, cart, user_voucher)
+            except InsufficientStockError as exc:
+                return Response(
+                    {"detail": _insufficient_stock_message(exc, order_items)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            except VoucherUnavailableError:
+                return Response(
+                    {"detail": "Voucher không hợp lệ hoặc đã được sử dụng"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             # Reload order to get order_number
             order.reload()
@@ -1565,6 +1606,38 @@ def _get_voucher_status_for_user(voucher):
     return "active"
 
 
+_WALLET_STATUS_FILTERS = {
+    # Active = not used, not expired and already started
+    "active": {"status": "active", "_expired": False, "_started": True},
+    # Expired = expired_date < now, whatever the wallet row says
+    "expired": {"_expired": True},
+    "used": {"status": "used"},
+}
+
+
+def _wallet_pipeline(user_id, status_filter, now):
+    """Aggregation for a user's voucher wallet, newest first."""
+    def has_date(field):
+        # A bare $lt would also treat a missing date as "before now"
+        return {"$eq": [{"$type": field}, "date"]}
+
+    pipeline = [
+        {"$match": {"user": user_id}},
+        {"$lookup": {"from": "vouchers", "localField": "voucher", "foreignField": "_id", "as": "_voucher"}},
+        # Without a filter rows whose voucher was deleted are still listed
+        {"$unwind": {"path": "$_voucher", "preserveNullAndEmptyArrays": not status_filter}},
+        {"$addFields": {
+            "_expired": {"$and": [has_date("$_voucher.expired_date"), {"$lt": ["$_voucher.expired_date", now]}]},
+            "_started": {"$or": [{"$not": [has_date("$_voucher.start_date")]}, {"$lte": ["$_voucher.start_date", now]}]},
+        }},
+    ]
+    if status_filter:
+        pipeline.append({"$match": _WALLET_STATUS_FILTERS[status_filter]})
+    pipeline.append({"$sort": {"added_at": -1}})
+    pipeline.append({"$project": {"_started": 0}})
+    return pipeline
+
+
 class UserVoucherListView(APIView):
     """GET /api/vouchers - Get user's vouchers"""
     
@@ -1572,62 +1645,28 @@ class UserVoucherListView(APIView):
     def get(self, request):
         """Get list of vouchers user has added"""
         try:
-            user_id = request.user_claims['sub']
-            user = User.objects(id=ObjectId(user_id)).first()
-            
-            if not user:
-                return Response(
-                    {"detail": "User not found"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+            user_id = ObjectId(request.user_claims['sub'])
             
             # Get status filter
             status_filter = (request.query_params.get("status") or "").strip().lower()
+            if status_filter and status_filter not in _WALLET_STATUS_FILTERS:
+                return Response({"data": []})
             
-            # Get user vouchers
-            user_vouchers = UserVoucher.objects(user=user)
-            
-            # Filter by status if provided
-            # Note: We'll filter after loading since MongoEngine doesn't support nested field queries easily
-            user_vouchers_list = list(user_vouchers)
-            
-            if status_filter:
-                now = datetime.utcnow()
-                filtered = []
-                for uv in user_vouchers_list:
-                    if uv.voucher:
-                        uv.voucher.reload()
-                        if status_filter == "active":
-                            # Active = not expired, not used, and started
-                            if (uv.status == "active" and 
-                                (not uv.voucher.expired_date or uv.voucher.expired_date >= now) and
-                                (not uv.voucher.start_date or uv.voucher.start_date <= now)):
-                                filtered.append(uv)
-                        elif status_filter == "expired":
-                            # Expired = expired_date < now
-                            if uv.voucher.expired_date and uv.voucher.expired_date < now:
-                                filtered.append(uv)
-                        elif status_filter == "used":
-                            if uv.status == "used":
-                                filtered.append(uv)
-                user_vouchers_list = filtered
-            
-            # Sort by added_at descending
-            user_vouchers_list.sort(key=lambda x: x.added_at or datetime.min, reverse=True)
+            # One aggregation: join vouchers, compute expiry against now, filter and sort
+            now = datetime.utcnow()
+            rows = list(UserVoucher._get_collection().aggregate(
+                _wallet_pipeline(user_id, status_filter, now)
+            ))
             
             # Serialize
             result = []
-            now = datetime.utcnow()
-            for uv in user_vouchers_list:
-                # Reload voucher reference
-                if uv.voucher:
-                    uv.voucher.reload()
-                    
-                    # Update status if expired
-                    if uv.status == "active" and uv.voucher.expired_date and uv.voucher.expired_date < now:
-                        uv.status = "expired"
-                        uv.save()
-                
+            for row in rows:
+                voucher_doc = row.pop("_voucher", None)
+                # Rows are persisted as expired by the expiry sweep; report it right away
+                if row.pop("_expired") and row.get("status") == "active":
+                    row["status"] = "expired"
+                uv = UserVoucher._from_son(row)
+                uv.voucher = Voucher._from_son(voucher_doc) if voucher_doc else None
                 result.append(_serialize_user_voucher(uv, include_voucher_details=True))
             
             return Response({"data": result})
@@ -1671,8 +1710,8 @@ class AddVoucherView(APIView):
             # Normalize code
             code = code.upper().strip()
             
-            # Find voucher by code
-            voucher = Voucher.objects(code=code).first()
+            # Find voucher by code (cached, including unknown codes)
+            voucher = get_voucher_by_code(code)
             if not voucher:
                 return Response(
                     {"detail": "Mã voucher không hợp lệ"},
@@ -1701,13 +1740,41 @@ class AddVoucherView(APIView):
                     status=status.HTTP_409_CONFLICT
                 )
             
+            # Single-use campaign codes go to the first user who claims them
+            if voucher.single_use:
+                claimed = Voucher._get_collection().update_one(
+                    {"_id": voucher.id, "claimed_by": None},
+                    {"$set": {"claimed_by": user.id}}
+                )
+                if claimed.matched_count == 0:
+                    return Response(
+                        {"detail": "Mã voucher đã được sử dụng"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+            
             # Create user voucher
             user_voucher = UserVoucher(
                 user=user,
                 voucher=voucher,
                 status="active"
             )
-            user_voucher.save()
+            try:
+                user_voucher.save()
+            except NotUniqueError:
+                # A concurrent request added it first (the user holds the
+                # voucher, so a single-use claim stays theirs)
+                return Response(
+                    {"detail": "Voucher đã được thêm vào tài khoản"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            except Exception:
+                # No wallet row: give the single-use code back
+                if voucher.single_use:
+                    Voucher._get_collection().update_one(
+                        {"_id": voucher.id, "claimed_by": user.id},
+                        {"$set": {"claimed_by": None}}
+                    )
+                raise
             
             # Reload voucher reference for serialization
             user_voucher.voucher.reload()
@@ -1780,6 +1847,14 @@ class RemoveVoucherView(APIView):
             # Delete user voucher
             user_voucher.delete()
             
+            # An unused single-use code goes back to the pool (the owner can
+            # add it again); a used one stays claimed
+            if voucher.single_use and user_voucher.status != "used":
+                Voucher._get_collection().update_one(
+                    {"_id": voucher.id, "claimed_by": user.id},
+                    {"$set": {"claimed_by": None}}
+                )
+            
             return Response(
                 {"message": "Xóa mã giảm giá thành công!"},
                 status=status.HTTP_200_OK
@@ -1813,6 +1888,7 @@ def _serialize_order_simple(order):
 
 class OrderListView(APIView):
     """GET /api/orders - Get list of orders with pagination and filters
+       (page/limit, or cursor/limit for keyset pagination)
        POST /api/orders - Create new order (delegates to OrderCreateView logic)"""
     
     @require_auth
@@ -1859,6 +1935,34 @@ class OrderListView(APIView):
             if status_filter:
                 query = query.filter(status=status_filter)
             
+            # Cursor mode: ?cursor= (empty for the first page) pages by (created_at, _id)
+            if 'cursor' in request.query_params:
+                cursor = request.query_params.get('cursor', '').strip()
+                include_total = request.query_params.get('includeTotal', 'false').lower() == 'true'
+                total = query.count() if include_total else None
+                try:
+                    orders, next_cursor = paginate_by_cursor(
+                        query, cursor, limit, descending=(sort_param != 'created_at')
+                    )
+                except ValueError:
+                    return Response(
+                        {"detail": "cursor không hợp lệ"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                pagination = {
+                    "limit": limit,
+                    "nextCursor": next_cursor,
+                    "hasNext": next_cursor is not None
+                }
+                if total is not None:
+                    pagination["total"] = total
+                
+                return Response(
+                    {"orders": _serialize_orders(orders), "pagination": pagination},
+                    status=status.HTTP_200_OK
+                )
+            
             # Sort
             if sort_param == 'created_at':
                 query = query.order_by('created_at')
@@ -1874,10 +1978,8 @@ class OrderListView(APIView):
             skip = (page - 1) * limit
             orders = query.skip(skip).limit(limit)
             
-            # Serialize orders
-            orders_list = []
-            for order in orders:
-                orders_list.append(_serialize_order(order))
+            # Serialize orders (addresses and vouchers fetched once per page)
+            orders_list = _serialize_orders(orders)
             
             # Build response
             response_data = {
@@ -2018,9 +2120,10 @@ class OrderStatusUpdateView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            # Validate status transition
-            # Only allow cancellation from "placed" or "pending"
-            if order.status not in ["placed", "pending"]:
+            # Only allow cancellation from "placed" or "pending"; the transition
+            # is conditional so a double cancel cannot restore stock twice
+            if not cancel_order(order, ["placed", "pending"]):
+                order.reload()
                 if order.status == "cancelled":
                     return Response(
                         {"detail": "Đơn hàng đã được hủy trước đó"},
@@ -2037,14 +2140,6 @@ class OrderStatusUpdateView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
             
-            # Map "placed" to "pending" if needed
-            if order.status == "placed":
-                order.status = "pending"
-            
-            # Update status to cancelled
-            order.status = "cancelled"
-            order.save()
-            
             # Reload to get updated data
             order.reload()
             
@@ -0,0 +1,45 @@
+"""
+Cached voucher lookups for the hot validate/add/checkout paths.
+
+Vouchers are cached as raw documents keyed by code and by id, and unknown
+codes are cached briefly too, so guessed codes do not each cost a query.
+Entries are dropped by change-stream invalidation (see common.cache) and,
+in the process that made the edit, immediately by the admin voucher views.
+"""
+import copy
+
+from common.cache import MISSING, TTLCache, invalidate, register
+from .models import Voucher
+
+VOUCHER_TTL_SECONDS = 300
+NEGATIVE_TTL_SECONDS = 15
+
+_cache = register(TTLCache("vouchers", ttl=VOUCHER_TTL_SECONDS, maxsize=4096), "vouchers")
+
+
+def _lookup(key, query):
+    son = _cache.get(key)
+    if son is MISSING:
+        son = Voucher._get_collection().find_one(query)
+        if son is None:
+            # Untagged, so creating any voucher (e.g. this code) drops it
+            _cache.set(key, None, ttl=NEGATIVE_TTL_SECONDS)
+        else:
+            _cache.set(key, son, tags=[son["_id"]])
+    # Callers get their own document; the cached raw dict is never handed out
+    return Voucher._from_son(copy.deepcopy(son)) if son is not None else None
+
+
+def get_voucher_by_code(code):
+    """Voucher with ``code`` (already normalized) or None."""
+    return _lookup(f"code:{code}", {"code": code})
+
+
+def get_voucher_by_id(voucher_id):
+    """Voucher with ObjectId ``voucher_id`` or None."""
+    return _lookup(f"id:{voucher_id}", {"_id": voucher_id})
+
+
+def invalidate_voucher(voucher_id=None):
+    """Drop cached entries for one voucher (plus negative entries), or all of them."""
+    invalidate("vouchers", voucher_id)
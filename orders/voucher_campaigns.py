@@ -0,0 +1,142 @@
+"""
+Bulk voucher operations run as background jobs: generating single-use
+campaign codes and dropping a voucher into the wallets of a user segment.
+"""
+import secrets
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from users.models import User
+from .customer_stats import customer_status_query
+from .models import UserVoucher, Voucher
+
+# No 0/O/1/I, so codes survive being read aloud or typed from a flyer
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+DEFAULT_CODE_LENGTH = 10
+MAX_CAMPAIGN_CODES = 500_000
+INSERT_CHUNK_SIZE = 5000
+ASSIGN_CHUNK_SIZE = 1000
+DUPLICATE_KEY = 11000
+
+SEGMENTS = ("all", "vip", "active", "inactive")
+
+
+def random_code(prefix="", length=DEFAULT_CODE_LENGTH):
+    return prefix + "".join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+
+
+def generate_campaign_codes(campaign, count, template, prefix="", length=DEFAULT_CODE_LENGTH, on_progress=None):
+    """
+    Insert ``count`` single-use vouchers for ``campaign`` built from ``template``.
+
+    Codes are random; the few that collide with existing codes (unique
+    index) are regenerated. Resumable: codes already created for the
+    campaign count towards ``count``, so a retried job finishes the batch.
+    """
+    collection = Voucher._get_collection()
+    created = collection.count_documents({"campaign": campaign})
+    collisions = 0
+
+    while created < count:
+        size = min(INSERT_CHUNK_SIZE, count - created)
+        codes = set()
+        while len(codes) < size:
+            codes.add(random_code(prefix, length))
+        now = datetime.utcnow()
+        docs = [
+            {
+                **template,
+                "code": code,
+                "campaign": campaign,
+                "single_use": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for code in codes
+        ]
+        try:
+            result = collection.insert_many(docs, ordered=False)
+            created += len(result.inserted_ids)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            # Unordered: everything but the colliding codes went in
+            created += exc.details.get("nInserted", 0)
+            collisions += len(errors)
+        if on_progress:
+            on_progress({"created": created, "total": count, "collisions": collisions})
+
+    return {"campaign": campaign, "created": created, "total": count, "collisions": collisions}
+
+
+def segment_user_ids(segment):
+    """
+    Yield ids of non-blocked customers in ``segment`` (see SEGMENTS).
+
+    vip/active/inactive follow the customer status of the admin customer
+    list, read from the materialized order stats.
+    """
+    query = {"role": "user", "blocked": {"$ne": True}}
+    if segment != "all":
+        query.update(customer_status_query(segment, datetime.utcnow()))
+    for doc in User._get_collection().find(query, {"_id": 1}):
+        yield doc["_id"]
+
+
+def existing_customer_ids(user_ids):
+    """Split explicit ``user_ids`` into (customer ids that exist, skipped ids), with one $in"""
+    found = {
+        doc["_id"]
+        for doc in User._get_collection().find({"_id": {"$in": list(user_ids)}, "role": "user"}, {"_id": 1})
+    }
+    kept = [user_id for user_id in user_ids if user_id in found]
+    skipped = [user_id for user_id in user_ids if user_id not in found]
+    return kept, skipped
+
+
+def assign_voucher(voucher_id, user_ids, on_progress=None):
+    """
+    Add ``voucher_id`` to the wallet of every user in ``user_ids``.
+
+    Unordered bulk upserts on the unique (user, voucher) index: users who
+    already hold the voucher are left untouched, so a retried job is safe.
+    """
+    collection = UserVoucher._get_collection()
+    processed = assigned = 0
+    chunk = []
+
+    def flush():
+        nonlocal processed, assigned
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"user": user_id, "voucher": voucher_id},
+                {"$setOnInsert": {"added_at": now, "status": "active"}},
+                upsert=True,
+            )
+            for user_id in chunk
+        ]
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            assigned += result.upserted_count
+        except BulkWriteError as exc:
+            # Two concurrent upserts of the same pair: the other one won
+            if any(error.get("code") != DUPLICATE_KEY for error in exc.details.get("writeErrors", [])):
+                raise
+            assigned += exc.details.get("nUpserted", 0)
+        processed += len(chunk)
+        chunk.clear()
+        if on_progress:
+            on_progress({"processed": processed, "assigned": assigned})
+
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) >= ASSIGN_CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+
+    return {"voucherId": str(voucher_id), "processed": processed, "assigned": assigned}
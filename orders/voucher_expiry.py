@@ -0,0 +1,78 @@
+"""
+Voucher expiry sweep.
+
+Marks wallet rows (``user_vouchers``) of vouchers whose ``expired_date``
+has passed as expired, so read paths can compute expiry without writing
+and admin stats do not count stale ``active`` rows. Each run only looks
+at vouchers that expired since the previous run, plus vouchers created
+or edited since then that are already past expiry (an admin can save a
+voucher with an expired_date in the past). These are found through the
+``expired_date`` and ``(updated_at, expired_date)`` indexes; the
+high-water mark is kept in the counters collection as a Unix timestamp.
+"""
+import calendar
+import time
+from datetime import datetime, timedelta
+
+from .counters import seed_counter
+from .models import Counter, UserVoucher, Voucher
+
+SWEEP_COUNTER = "voucher_expiry_sweep"
+BATCH_SIZE = 500
+# Re-check a little before the mark so vouchers saved with a slightly
+# skewed clock are not skipped
+OVERLAP = timedelta(minutes=5)
+
+
+def _last_swept_until():
+    counter = Counter.objects(name=SWEEP_COUNTER).first()
+    if not counter or not counter.seq:
+        return None
+    return datetime.utcfromtimestamp(counter.seq)
+
+
+def sweep_expired_vouchers(now=None, batch_size=BATCH_SIZE, full=False, on_progress=None):
+    """
+    Expire active wallet rows of vouchers that expired up to ``now``.
+
+    Returns run metrics. ``full`` ignores the high-water mark and
+    re-checks every expired voucher. ``on_progress(metrics)`` is called
+    after each batch.
+    """
+    started = time.monotonic()
+    now = now or datetime.utcnow()
+    since = None if full else _last_swept_until()
+
+    query = {"expired_date": {"$lte": now}}
+    if since:
+        query = {"$or": [
+            {"expired_date": {"$gt": since - OVERLAP, "$lte": now}},
+            {"updated_at": {"$gt": since - OVERLAP}, "expired_date": {"$lte": now}},
+        ]}
+    cursor = Voucher._get_collection().find(query, {"_id": 1}).batch_size(batch_size)
+
+    metrics = {"since": since.isoformat() if since else None, "vouchers": 0, "rows": 0, "batches": 0}
+    batch = []
+
+    def flush():
+        result = UserVoucher._get_collection().update_many(
+            {"voucher": {"$in": batch}, "status": "active"},
+            {"$set": {"status": "expired"}},
+        )
+        metrics["vouchers"] += len(batch)
+        metrics["rows"] += result.modified_count
+        metrics["batches"] += 1
+        batch.clear()
+        if on_progress:
+            on_progress(metrics)
+
+    for doc in cursor:
+        batch.append(doc["_id"])
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    seed_counter(SWEEP_COUNTER, calendar.timegm(now.utctimetuple()))
+    metrics["durationMs"] = round((time.monotonic() - started) * 1000)
+    return metrics
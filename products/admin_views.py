@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from users.auth import require_admin
+from common.outbox import record_event
 from .models import Brand, ParentCategory, ChildCategory, Product, Banner
 from bson import ObjectId
 from bson.errors import InvalidId
@@ -15,6 +16,11 @@ import os
 import uuid
 
 
+def _record_product_event(product_id, action):
+    """Emit product.updated so caches and search indexes can refresh this product."""
+    record_event("product.updated", {"productId": str(product_id), "action": action})
+
+
 def upload_image_files(request_files, product_id=None):
     """
     Helper function to upload image files to storage.
@@ -942,6 +948,7 @@ class ProductListView(APIView):
                     product.sizes = sizes_list
             
             product.save()
+            _record_product_event(product.id, "created")
             
             # Note: Files are uploaded with temp ID in filename, but URLs are already generated correctly
             # No need to rename files - the URLs work fine as-is
@@ -1155,6 +1162,7 @@ class ProductDetailView(APIView):
         
         try:
             product.save()
+            _record_product_event(product.id, "updated")
             return Response({
                 "id": str(product.id),
                 "name": product.name,
@@ -1183,6 +1191,7 @@ class ProductDetailView(APIView):
             )
         
         product.delete()
+        _record_product_event(product_id, "deleted")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -1230,6 +1239,7 @@ class ProductImageUploadView(APIView):
         existing_images = product.images or []
         product.images = existing_images + uploaded_urls
         product.save()
+        _record_product_event(product.id, "updated")
         
         return Response({
             "images": product.images
@@ -0,0 +1,43 @@
+"""
+Index registry for the products app (applied by ``manage.py sync_indexes``).
+
+Includes the search indexes previously created by setup_search_indexes.py.
+"""
+from pymongo import ASCENDING, TEXT
+
+INDEXES = {
+    "products": [
+        {
+            "keys": [
+                ("name.vi", TEXT), ("name.en", TEXT), ("name.ja", TEXT),
+                ("description.vi", TEXT), ("description.en", TEXT), ("description.ja", TEXT),
+                ("tags", TEXT),
+            ],
+            "name": "product_search_text_index",
+            "weights": {
+                "name.vi": 10, "name.en": 10, "name.ja": 10,
+                "description.vi": 5, "description.en": 5, "description.ja": 5,
+                "tags": 7,
+            },
+            "default_language": "none",
+        },
+        {"keys": [("stock", ASCENDING)]},
+        {"keys": [("status", ASCENDING), ("stock", ASCENDING)]},
+    ],
+    "brands": [
+        {
+            "keys": [("name.vi", TEXT), ("name.en", TEXT), ("name.ja", TEXT)],
+            "name": "brand_search_text_index",
+            "weights": {"name.vi": 10, "name.en": 10, "name.ja": 10},
+            "default_language": "none",
+        },
+    ],
+}
+
+QUERIES = [
+    {
+        "name": "active products in stock",
+        "collection": "products",
+        "filter": {"status": "active", "stock": {"$gt": 0}},
+    },
+]
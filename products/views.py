@@ -4,6 +4,7 @@ from rest_framework import status
 from bson import ObjectId
 from bson.errors import InvalidId
 
+from common.cache import TTLCache, register
 from orders.models import OrderReview
 from users.auth import require_auth
 from users.models import User
@@ -16,6 +17,16 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Public navigation data, invalidated through change streams (see common.cache)
+_banner_cache = register(TTLCache("public_banners", ttl=600), "banners")
+_brand_cache = register(TTLCache("public_brands", ttl=600), "brands")
+_category_cache = register(
+    TTLCache("public_categories", ttl=600),
+    "parent_categories", "child_categories",
+)
+# Product counts only move when a product is added, removed, re-categorised or (de)activated
+register(_category_cache, "products", fields=("category", "status"))
+
 
 def _pick_lang(value, lang: str, default_lang: str = 'vi'):
     """Return localized string from value which may be a dict or a plain string."""
@@ -187,8 +198,12 @@ class PublicBannerListView(APIView):
 
     def get(self, request):
         lang = (request.query_params.get('lang') or 'vi').strip() or 'vi'
+        return Response({"data": _banner_cache.get_or_set(lang, lambda: self._load(lang))})
+
+    @staticmethod
+    def _load(lang):
         banners = Banner.objects(status="active").order_by('order')
-        data = [
+        return [
             {
                 "id": str(b.id),
                 "image": b.image,
@@ -198,7 +213,6 @@ class PublicBannerListView(APIView):
             }
             for b in banners
         ]
-        return Response({"data": data})
 
 
 class PublicBrandListView(APIView):
@@ -208,8 +222,12 @@ class PublicBrandListView(APIView):
 
     def get(self, request):
         lang = (request.query_params.get('lang') or 'vi').strip() or 'vi'
+        return Response({"data": _brand_cache.get_or_set(lang, lambda: self._load(lang))})
+
+    @staticmethod
+    def _load(lang):
         brands = Brand.objects(status="active").order_by('name')
-        data = [
+        return [
             {
                 "id": str(br.id),
                 "name": _pick_lang(br.name, lang),
@@ -219,7 +237,6 @@ class PublicBrandListView(APIView):
             }
             for br in brands
         ]
-        return Response({"data": data})
 
 
 class PublicProductsListView(APIView):
@@ -899,6 +916,10 @@ class PublicCategoriesView(APIView):
 
     def get(self, request):
         lang = (request.query_params.get('lang') or 'vi').strip() or 'vi'
+        return Response({"data": _category_cache.get_or_set(lang, lambda: self._load(lang))})
+
+    @staticmethod
+    def _load(lang):
         parents = ParentCategory.objects(status="active")
         result = []
         for parent in parents:
@@ -917,7 +938,7 @@ class PublicCategoriesView(APIView):
                     for ch in children
                 ]
             })
-        return Response({"data": result})
+        return result
 
 
 class PublicReviewsView(APIView):
@@ -5,6 +5,9 @@ This script should be run once to set up the necessary indexes for optimal searc
 
 Usage:
     python setup_search_indexes.py
+
+Note: these indexes are also declared in products/indexes.py; prefer
+`python manage.py sync_indexes`, which manages the indexes of every app.
 """
 
 import os
@@ -0,0 +1,53 @@
+"""
+Index registry for the users app (applied by ``manage.py sync_indexes``).
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING
+
+INDEXES = {
+    "users": [
+        # Customer counts and new-customer stats on the dashboard
+        {"keys": [("role", ASCENDING), ("created_at", DESCENDING)]},
+        # Admin order search: anchored prefix lookups of customers on the
+        # lowercased email/phone/username/displayName (backfill_search_keys)
+        {"keys": [("role", ASCENDING), ("search_keys", ASCENDING)]},
+        # Admin customer list sorted by materialized order stats / join date
+        {"keys": [("role", ASCENDING), ("order_stats.total_spent", DESCENDING), ("_id", DESCENDING)]},
+        {"keys": [("role", ASCENDING), ("order_stats.total_orders", DESCENDING), ("_id", DESCENDING)]},
+        {"keys": [("role", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]},
+        # Customer status filters (vip / active / inactive) and segment counts
+        {"keys": [("role", ASCENDING), ("order_stats.last_order_at", DESCENDING)]},
+    ],
+}
+
+QUERIES = [
+    {
+        "name": "new customers in period",
+        "collection": "users",
+        "filter": {"role": "user", "created_at": {"$gte": datetime.utcnow() - timedelta(days=30)}},
+    },
+    {
+        "name": "admin order search: customers by prefix",
+        "collection": "users",
+        "filter": {"role": "user", "search_keys": {"$regex": "^nguyen"}},
+        "limit": 1001,
+    },
+    {
+        "name": "admin customers sorted by total spent",
+        "collection": "users",
+        "filter": {"role": "user"},
+        "sort": [("order_stats.total_spent", DESCENDING), ("_id", DESCENDING)],
+        "limit": 20,
+    },
+    {
+        "name": "active customers",
+        "collection": "users",
+        "filter": {
+            "role": "user",
+            "blocked": {"$ne": True},
+            "order_stats.total_orders": {"$lte": 10},
+            "order_stats.last_order_at": {"$gte": datetime.utcnow() - timedelta(days=30)},
+        },
+    },
+]
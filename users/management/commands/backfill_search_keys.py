@@ -0,0 +1,53 @@
+"""
+Fill User.search_keys (lowercased email, phone, username and display name)
+on existing users.
+
+Users get it on save; older ones need this once for the admin order search
+by customer. Safe to re-run: only users without search_keys are touched.
+
+The keys are computed here rather than with $toLower, which only lowercases
+ASCII and would miss Vietnamese capitals (Đ, Ă, ...).
+
+Usage:
+    python manage.py backfill_search_keys
+    python manage.py backfill_search_keys --batch-size 10000
+"""
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from users.models import User, search_keys_for
+
+
+class Command(BaseCommand):
+    help = "Backfill search_keys on users created before it existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Users per update")
+
+    def handle(self, *args, **options):
+        collection = User._get_collection()
+        batch_size = options["batch_size"]
+        updated = batches = 0
+        while True:
+            docs = list(
+                collection.find(
+                    {"search_keys": {"$exists": False}},
+                    {"email": 1, "phone": 1, "username": 1, "displayName": 1},
+                ).limit(batch_size)
+            )
+            if not docs:
+                break
+            result = collection.bulk_write([
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$set": {"search_keys": search_keys_for(
+                        doc.get("email"), doc.get("phone"), doc.get("username"), doc.get("displayName")
+                    )}},
+                )
+                for doc in docs
+            ], ordered=False)
+            updated += result.modified_count
+            batches += 1
+            self.stdout.write(f"  batch {batches}: {result.modified_count} user(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ search_keys set on {updated} user(s)"))
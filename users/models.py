@@ -9,6 +9,26 @@ class ProviderLink(me.EmbeddedDocument):
     provider_user_id = me.StringField(required=True)
 
 
+class OrderStats(me.EmbeddedDocument):
+    """Order statistics maintained by orders/customer_stats.py"""
+    total_orders = me.IntField(default=0)
+    total_spent = me.FloatField(default=0)
+    first_order_at = me.DateTimeField()
+    last_order_at = me.DateTimeField()
+    rebuilt_at = me.DateTimeField()
+    applied_events = me.ListField(me.StringField())
+
+
+def search_keys_for(*values):
+    """Distinct lowercased, stripped non-empty values"""
+    keys = []
+    for value in values:
+        key = (value or "").strip().lower()
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
 # BÂY GIỜ ĐỊNH NGHĨA USER, VÌ ADDRESS SẼ CẦN NÓ
 class User(me.Document):
     # --- Thông tin đăng nhập ---
@@ -39,6 +59,12 @@ class User(me.Document):
     # --- Admin settings ---
     blocked = me.BooleanField(default=False)  # Admin can block user manually
 
+    # --- Order statistics (materialized from order events) ---
+    order_stats = me.EmbeddedDocumentField(OrderStats)
+
+    # --- Lowercased email/phone/username/displayName, for case-insensitive prefix search ---
+    search_keys = me.ListField(me.StringField())
+
     # --- Metadata ---
     created_at = me.DateTimeField(default=datetime.utcnow)
 
@@ -51,6 +77,9 @@ class User(me.Document):
         ]
     }
 
+    def clean(self):
+        self.search_keys = search_keys_for(self.email, self.phone, self.username, self.displayName)
+
     @property
     def is_authenticated(self):
         """DRF expects Django users to expose this flag."""